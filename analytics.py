@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from mongodb import activityStats, dayOf, parseDate
+
+
+#Activity summaries ---------------------------------------------------------------------------
+#Answers !stats and /LOGS/stats from the activity buckets (one per author per day), never from
+#the logs. The buckets are read into NumPy arrays once and every number is computed on those.
+def window(since=None, until=None, days=7):
+  #Whole days: until defaults to the end of today, since to days before until
+  until = dayOf(until) if until else dayOf(datetime.now(timezone.utc)) + timedelta(days=1)
+  since = dayOf(since) if since else until - timedelta(days=days)
+  if since >= until:
+    raise ValueError("since must be before until")
+  return since, until
+
+
+def percentiles(values, points):
+  if not len(values):
+    return {f"p{point}": 0.0 for point in points}
+  return {
+    f"p{point}": float(value)
+    for point, value in zip(points, np.percentile(values, points))
+  }
+
+
+def summarize(buckets, since, until, top=10):
+  days = (until - since).days
+  authors = sorted({bucket["author"] for bucket in buckets})
+  authorIndex = {author: i for i, author in enumerate(authors)}
+  count = len(buckets)
+  author = np.fromiter((authorIndex[b["author"]] for b in buckets), np.int64, count)
+  day = np.fromiter(((dayOf(b["day"]) - since).days for b in buckets), np.int64, count)
+  messages = np.fromiter((b["messages"] for b in buckets), np.float64, count)
+  characters = np.fromiter((b.get("characters", 0) for b in buckets), np.float64, count)
+
+  perDay = np.bincount(day, weights=messages, minlength=days)
+  authorsPerDay = np.bincount(day, minlength=days)
+  perAuthor = np.bincount(author, weights=messages, minlength=len(authors))
+  charactersPerAuthor = np.bincount(author, weights=characters, minlength=len(authors))
+  topAuthors = np.argsort(-perAuthor, kind="stable")[:top]
+  #Average of each day and the 6 before it, from the 7th day on
+  movingAverage = np.convolve(perDay, np.ones(7) / 7, mode="valid") if days >= 7 else []
+  #Messages per day gained (or lost) each day, least squares over the window
+  trend = float(np.polyfit(np.arange(days), perDay, 1)[0]) if days > 1 else 0.0
+  busiest = int(perDay.argmax()) if days else 0
+
+  return {
+    "since": since.isoformat(),
+    "until": until.isoformat(),
+    "messages": int(messages.sum()),
+    "characters": int(characters.sum()),
+    "authors": len(authors),
+    "topAuthors": [{
+      "author": authors[i],
+      "messages": int(perAuthor[i]),
+      "averageLength": round(float(charactersPerAuthor[i] / perAuthor[i]), 1)
+    } for i in topAuthors],
+    "perDay": [{
+      "day": (since + timedelta(days=i)).date().isoformat(),
+      "messages": int(perDay[i]),
+      "authors": int(authorsPerDay[i])
+    } for i in range(days)],
+    "movingAverage7": [round(float(value), 2) for value in movingAverage],
+    "messagesPerDay": {
+      "mean": float(perDay.mean()) if days else 0.0,
+      **percentiles(perDay, [50, 90])
+    },
+    "messagesPerAuthor": percentiles(perAuthor, [50, 90, 99]),
+    "busiestDay": {
+      "day": (since + timedelta(days=busiest)).date().isoformat(),
+      "messages": int(perDay[busiest]) if days else 0
+    },
+    "trend": round(trend, 3),
+  }
+
+
+def stats(since=None, until=None, author=None, top=10, days=7):
+  #Raises ValueError for bad dates
+  since, until = window(parseDate(since), parseDate(until), days)
+  return summarize(activityStats(since, until, author), since, until, top)
@@ -0,0 +1,95 @@
+import asyncio, fcntl, logging, os
+from a2wsgi import WSGIMiddleware
+from main import app, client, runDiscord
+from mongodb import buildIndexes, watchSessions, startSearchIndex, repairActivity, sessionCache
+from config import config
+
+log = logging.getLogger(__name__)
+
+#Production mode -----------------------------------------------------------------------------
+#  uvicorn asgi:application --host 0.0.0.0 --port 1500
+#The Flask routes run on a pool of WEB_THREADS threads, so a long /LOGS stream or a login
+#waiting on the hash pool only holds up its own request. The discord client runs as a task
+#on uvicorn's loop. One process is the default; with --workers N every worker serves the
+#routes (each with its own MongoClient) but only the one that gets the lock file runs the
+#discord client, so the bot never logs in twice. If that worker dies the lock is released
+#and the next worker to start picks the bot up.
+DISCORD_LOCK_FILE = config.get("DISCORD_LOCK_FILE", "/tmp/discordbot.lock")
+ACTIVITY_REPAIR_SECONDS = float(config.get("ACTIVITY_REPAIR_SECONDS", 3600))
+WEB_THREADS = int(config.get("WEB_THREADS", 32))
+#With several workers a login or logout lands on any one of them, so the change stream keeps
+#every worker's session cache in sync. It is on by default then, and turning it off turns the
+#session caches off, the bot's worker would otherwise trust a logout it never saw for minutes.
+WEB_WORKERS = int(config.get("WEB_WORKERS", 1))
+SESSION_CHANGE_STREAM = config.get("SESSION_CHANGE_STREAM", "1" if WEB_WORKERS > 1 else "0") == "1"
+
+wsgi = WSGIMiddleware(app, workers=WEB_THREADS)
+
+
+class Application:
+
+  def __init__(self):
+    self.lockFile = None
+    self.discordTask = None
+
+  def takeLock(self):
+    lockFile = open(DISCORD_LOCK_FILE, "w")
+    try:
+      fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+      lockFile.close()
+      return False
+    self.lockFile = lockFile
+    return True
+
+  async def startup(self):
+    loop = asyncio.get_running_loop()
+    if SESSION_CHANGE_STREAM:
+      #Every worker has its own session cache to keep in sync
+      watchSessions()
+    elif WEB_WORKERS > 1:
+      sessionCache.disable()
+    #SEARCH_BACKEND=local: every worker answers /LOGS/search from its own index
+    startSearchIndex()
+    if self.takeLock():
+      log.info("Worker %d runs the discord client", os.getpid())
+      #In the background, a slow database shouldn't hold up the web server
+      loop.run_in_executor(None, buildIndexes)
+      self.discordTask = loop.create_task(runDiscord())
+      #Recounting the recent activity buckets only needs to happen in one worker
+      if ACTIVITY_REPAIR_SECONDS > 0:
+        repairActivity(ACTIVITY_REPAIR_SECONDS)
+
+  async def shutdown(self):
+    if self.discordTask is not None:
+      await client.close()
+      try:
+        await self.discordTask
+      except Exception as e:
+        log.error("Discord client stopped with: %s", e)
+    if self.lockFile is not None:
+      self.lockFile.close()
+
+  async def lifespan(self, receive, send):
+    while True:
+      message = await receive()
+      if message["type"] == "lifespan.startup":
+        try:
+          await self.startup()
+        except Exception as e:
+          await send({"type": "lifespan.startup.failed", "message": str(e)})
+          return
+        await send({"type": "lifespan.startup.complete"})
+      elif message["type"] == "lifespan.shutdown":
+        await self.shutdown()
+        await send({"type": "lifespan.shutdown.complete"})
+        return
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] == "lifespan":
+      await self.lifespan(receive, send)
+    else:
+      await wsgi(scope, receive, send)
+
+
+application = Application()
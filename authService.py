@@ -0,0 +1,62 @@
+import asyncio, logging, uuid
+from concurrent.futures import ThreadPoolExecutor
+from mongodb import createUser, loginUser, signOutUser, lookupSession, sessionCache
+from passwordHasher import hasher, HasherBusy
+from config import config
+
+log = logging.getLogger(__name__)
+
+#Auth service ---------------------------------------------------------------------------------
+#Used directly by both the Flask routes (through user.models.User) and the discord commands,
+#so the bot doesn't have to post to its own Flask server to log someone in.
+#Every function returns [json, status] like the mongodb functions do.
+
+#pymongo blocks, the async versions run on this pool so the gateway loop keeps going
+executor = ThreadPoolExecutor(max_workers=int(config.get("AUTH_WORKERS", 4)),
+                              thread_name_prefix="auth")
+
+
+def register(query):
+  try:
+    password = hasher.hash(query["password"])
+  except HasherBusy as e:
+    return [{"error": f"{e}, try again later"}, 503]
+  user = {"_id": uuid.uuid4().hex, "name": query["name"], "password": password}
+  return createUser(user)
+
+
+def login(query):
+  return loginUser(query)
+
+
+def logout(query):
+  return signOutUser(query)
+
+
+async def runAsync(function, query):
+  loop = asyncio.get_running_loop()
+  return await loop.run_in_executor(executor, function, query)
+
+
+async def registerAsync(query):
+  return await runAsync(register, query)
+
+
+async def loginAsync(query):
+  return await runAsync(login, query)
+
+
+async def logoutAsync(query):
+  return await runAsync(logout, query)
+
+
+async def checkAsync(author):
+  #Cache hits answer right away, only misses go to mongodb on the pool
+  loggedIn = sessionCache.get(author)
+  if loggedIn is None:
+    try:
+      loggedIn = await runAsync(lookupSession, author)
+    except Exception:
+      log.exception("Session lookup failed for %s", author)
+      return False
+  return loggedIn
@@ -0,0 +1,42 @@
+#Compares %login/%logout throughput through the old loopback HTTP hop and through authService.
+#Needs main.py running (for the HTTP side) and the mongodb from .env reachable.
+#  python benchmarks/authCommands.py --name test --password test --count 200
+import argparse, asyncio, os, sys, time
+import requests as req
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import authService
+
+
+def viaHttp(args):
+  session = req.Session()
+  start = time.perf_counter()
+  for i in range(args.count):
+    user = f"bench#{i}"
+    session.post(url=f"{args.url}/user/login",
+                 json={"name": args.name, "user": user, "password": args.password})
+    session.post(url=f"{args.url}/user/logout", json={"user": user})
+  return args.count / (time.perf_counter() - start)
+
+
+async def viaService(args):
+  async def one(i):
+    user = f"bench#{i}"
+    await authService.loginAsync({"name": args.name, "user": user, "password": args.password})
+    await authService.logoutAsync({"user": user})
+
+  start = time.perf_counter()
+  await asyncio.gather(*(one(i) for i in range(args.count)))
+  return args.count / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--name", required=True)
+  parser.add_argument("--password", required=True)
+  parser.add_argument("--count", type=int, default=200)
+  parser.add_argument("--url", default="http://127.0.0.1:1500")
+  args = parser.parse_args()
+
+  print(f"loopback http: {viaHttp(args):.1f} commands/sec")
+  print(f"authService:   {asyncio.run(viaService(args)):.1f} commands/sec")
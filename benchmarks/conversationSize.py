@@ -0,0 +1,24 @@
+#Prompt size and per-call time over a long session, with the OpenAI request swapped for an echo.
+#  python benchmarks/conversationSize.py --messages 10000
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import chatgptAPI
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--messages", type=int, default=10000)
+  parser.add_argument("--users", type=int, default=1)
+  args = parser.parse_args()
+
+  sizes = []
+  chatgptAPI.complete = lambda messages: sizes.append(
+    sum(chatgptAPI.countTokens(m["content"]) for m in messages)) or "Sure, here is a fairly ordinary answer " * 5
+  print(f"{'messages':>10} {'prompt tokens':>14} {'us/call':>10}")
+  start = time.perf_counter()
+  for i in range(1, args.messages + 1):
+    chatgptAPI.call(f"question number {i} about something that matters " * 3, f"user{i % args.users}")
+    if i % (args.messages // 10) == 0:
+      elapsed = (time.perf_counter() - start) / (args.messages // 10) * 1e6
+      print(f"{i:10} {sizes[-1]:14} {elapsed:10.1f}")
+      start = time.perf_counter()
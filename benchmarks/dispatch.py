@@ -0,0 +1,64 @@
+#Cost of CommandRouter.dispatch per message for plain chat and for commands, with no-op handlers
+#and a login check that always passes.
+#  python benchmarks/dispatch.py --messages 200000
+import argparse, asyncio, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from commandRouter import CommandRouter
+
+
+class FakeAuthor:
+
+  async def send(self, content):
+    pass
+
+
+class FakeMessage:
+  author = FakeAuthor()
+
+
+def buildRouter():
+  #Same table as main.py
+  router = CommandRouter()
+
+  async def handler(msg, **args):
+    pass
+
+  router.command("%", "register", args=["name", "password"], sep="-")(handler)
+  router.command("%", "login", args=["name", "password"], sep="-")(handler)
+  router.command("%", "logout")(handler)
+  router.command("!", "deleteM", args=["since?", "until?"], auth=True)(handler)
+  router.command("!", "deleteP", args=["name", "since?", "until?"], auth=True)(handler)
+  router.command("!", "read", args=["name", "since?", "until?"], auth=True)(handler)
+  router.command("?", "songs", args=["first", "last"], sep="-", auth=True)(handler)
+  router.command("?", "roblox", args=["user", "password"], sep="-", auth=True)(handler)
+  router.fallback("?", args=["prompt"], auth=True)(handler)
+  return router
+
+
+async def main(args):
+  router = buildRouter()
+  msg = FakeMessage()
+
+  async def authorized(msg):
+    return True
+
+  shapes = {
+    "plain chat": "hey everyone, anyone up for a game tonight?",
+    "empty": "",
+    "%login": "%login-someone-hunter2",
+    "!read": "!read someone#0000 2023-10-01",
+    "?songs": "?songs-0-10",
+    "? chatgpt": "?what is the capital of france",
+  }
+  for name, content in shapes.items():
+    start = time.perf_counter()
+    for _ in range(args.messages):
+      await router.dispatch(msg, content, authorized)
+    print(f"{name:12} {(time.perf_counter() - start) / args.messages * 1e9:8.0f} ns/message")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--messages", type=int, default=200000)
+  asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,53 @@
+#DMs needed and time taken for !read / ?songs style output, one send per line vs dmBatcher.
+#The fake channel sleeps like a Discord DM bucket: 5 sends per 5 seconds (scaled by --scale).
+#  python benchmarks/dmBatching.py --lines 100
+import argparse, asyncio, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from dmBatcher import sendLines
+
+
+class FakeDM:
+
+  def __init__(self, latency, bucketSize, bucketWindow):
+    self.latency = latency
+    self.bucketSize = bucketSize
+    self.bucketWindow = bucketWindow
+    self.sends = []
+
+  async def send(self, content=None, file=None):
+    #Waits for the bucket like discord.py's HTTPClient does, then pays the request latency
+    now = time.perf_counter()
+    recent = [t for t in self.sends if now - t < self.bucketWindow]
+    if len(recent) >= self.bucketSize:
+      await asyncio.sleep(self.bucketWindow - (now - recent[0]))
+    self.sends.append(time.perf_counter())
+    await asyncio.sleep(self.latency)
+
+
+async def perLine(channel, lines):
+  for line in lines:
+    await channel.send(line)
+
+
+async def main(args):
+  lines = [f"{i}) Some Song Name {i} by Some Artist Featuring Someone Else" for i in range(args.lines)]
+  make = lambda: FakeDM(0.1 * args.scale, 5, 5.0 * args.scale)
+
+  channel = make()
+  start = time.perf_counter()
+  await perLine(channel, lines)
+  print(f"one DM per line: {len(channel.sends):5} sends {time.perf_counter() - start:8.2f} s")
+
+  channel = make()
+  start = time.perf_counter()
+  await sendLines(channel, lines, maxMessages=args.maxMessages)
+  print(f"dmBatcher:       {len(channel.sends):5} sends {time.perf_counter() - start:8.2f} s")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--lines", type=int, default=100)
+  parser.add_argument("--maxMessages", type=int, default=5)
+  parser.add_argument("--scale", type=float, default=0.1)
+  asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,216 @@
+#Memory and CPU the discord client spends on gateway events, for the old profile (every intent,
+#members cached, 1000 messages cached) against DISCORD_INTENTS=minimal. The events are replayed
+#straight into the client's parsers, filtered the way discord filters them for each intent set.
+#They are generated (guilds full of members with presences, then a stream of messages, presence
+#and member updates and typing) unless --payloads gives a file recorded with
+#DISCORD_RECORD_PAYLOADS=path.jsonl while the bot runs with DISCORD_INTENTS=all.
+#  python benchmarks/gatewayMemory.py --guilds 5 --members 5000 --events 50000
+import argparse, asyncio, gc, json, os, random, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import discord
+from gateway import buildIntents, buildMemberCacheFlags
+
+PROFILES = {
+  "all": ("all", "intents", 1000),
+  "minimal": ("minimal", "none", None),
+}
+JOINED = "2023-01-01T00:00:00+00:00"
+
+
+#Generated payloads ---------------------------------------------------------------------------
+def user(id):
+  return {
+    "id": str(id),
+    "username": f"user{id}",
+    "global_name": f"User {id}",
+    "discriminator": "0",
+    "avatar": None
+  }
+
+
+def member(id):
+  return {"user": user(id), "roles": [], "joined_at": JOINED, "deaf": False, "mute": False, "flags": 0}
+
+
+def presence(id, guildId):
+  return {
+    "user": {"id": str(id)},
+    "guild_id": str(guildId),
+    "status": random.choice(["online", "idle", "dnd"]),
+    "activities": [{"name": "Some Game", "type": 0, "created_at": 0}],
+    "client_status": {"desktop": "online"}
+  }
+
+
+def guild(guildId, members, channels):
+  firstMember = guildId * 1000000
+  return {
+    "id": str(guildId),
+    "name": f"guild {guildId}",
+    "owner_id": str(firstMember),
+    "roles": [{
+      "id": str(guildId),
+      "name": "@everyone",
+      "permissions": "104324673",
+      "position": 0,
+      "color": 0,
+      "hoist": False,
+      "managed": False,
+      "mentionable": False,
+      "flags": 0
+    }],
+    "emojis": [],
+    "stickers": [],
+    "features": [],
+    "member_count": members,
+    "large": members > 250,
+    "channels": [{
+      "id": str(guildId + channel + 1),
+      "type": 0,
+      "name": f"channel{channel}",
+      "position": channel,
+      "permission_overwrites": []
+    } for channel in range(channels)],
+    "threads": [],
+    "voice_states": [],
+    "stage_instances": [],
+    "guild_scheduled_events": [],
+    "members": [member(firstMember + i) for i in range(members)],
+    "presences": [presence(firstMember + i, guildId) for i in range(members)],
+  }
+
+
+def message(id, guildId, channels, authorId):
+  return {
+    "id": str(id),
+    "channel_id": str(guildId + random.randrange(channels) + 1),
+    "guild_id": str(guildId),
+    "author": user(authorId),
+    "member": {"roles": [], "joined_at": JOINED, "deaf": False, "mute": False, "flags": 0},
+    "content": f"message number {id} with a bit of text in it",
+    "timestamp": "2023-10-01T12:00:00+00:00",
+    "edited_timestamp": None,
+    "tts": False,
+    "mention_everyone": False,
+    "mentions": [],
+    "mention_roles": [],
+    "attachments": [],
+    "embeds": [],
+    "pinned": False,
+    "type": 0
+  }
+
+
+def generate(args):
+  random.seed(args.seed)
+  guildIds = [(i + 1) * 10000000 for i in range(args.guilds)]
+  for guildId in guildIds:
+    yield "GUILD_CREATE", guild(guildId, args.members, args.channels)
+  kinds = ["MESSAGE_CREATE", "PRESENCE_UPDATE", "GUILD_MEMBER_UPDATE", "TYPING_START"]
+  for i in range(args.events):
+    guildId = random.choice(guildIds)
+    memberId = guildId * 1000000 + random.randrange(args.members)
+    kind = random.choices(kinds, weights=[40, 40, 10, 10])[0]
+    if kind == "MESSAGE_CREATE":
+      yield kind, message(10**17 + i, guildId, args.channels, memberId)
+    elif kind == "PRESENCE_UPDATE":
+      yield kind, presence(memberId, guildId)
+    elif kind == "GUILD_MEMBER_UPDATE":
+      yield kind, {**member(memberId), "guild_id": str(guildId), "nick": f"nick{i}"}
+    else:
+      yield kind, {
+        "channel_id": str(guildId + 1),
+        "guild_id": str(guildId),
+        "user_id": str(memberId),
+        "timestamp": 0,
+        "member": member(memberId)
+      }
+
+
+def recorded(path):
+  with open(path) as file:
+    for line in file:
+      payload = json.loads(line)
+      yield payload["t"], payload["d"]
+
+
+#What discord sends for an intent set --------------------------------------------------------
+EVENT_INTENTS = {
+  "PRESENCE_UPDATE": "presences",
+  "GUILD_MEMBER_ADD": "members",
+  "GUILD_MEMBER_UPDATE": "members",
+  "GUILD_MEMBER_REMOVE": "members",
+  "TYPING_START": "guild_typing",
+  "MESSAGE_CREATE": "guild_messages",
+}
+
+
+def filterEvent(event, data, intents):
+  if event == "GUILD_CREATE":
+    data = dict(data)
+    if not intents.presences:
+      data["presences"] = []
+    if not intents.members:
+      #Only the members in voice (and the bot) come with the guild
+      data["members"] = []
+    return data
+  needs = EVENT_INTENTS.get(event)
+  if "guild_id" not in data and needs in ("guild_messages", "guild_typing"):
+    needs = "dm_messages" if needs == "guild_messages" else "dm_typing"
+  if needs and not getattr(intents, needs):
+    return None
+  if event == "MESSAGE_CREATE" and not intents.message_content:
+    data = {**data, "content": ""}
+  return data
+
+
+async def replay(name, events, args):
+  intents, memberCache, maxMessages = PROFILES[name]
+  intents = buildIntents(intents)
+  client = discord.Client(intents=intents,
+                          member_cache_flags=buildMemberCacheFlags(memberCache, intents),
+                          max_messages=maxMessages,
+                          chunk_guilds_at_startup=False)
+  client.loop = asyncio.get_running_loop()
+  state = client._connection
+  state.user = discord.ClientUser(state=state, data=user(1))
+  received = 0
+  gc.collect()
+  tracemalloc.start()
+  start = time.process_time()
+  for event, data in events:
+    data = filterEvent(event, data, intents)
+    if data is None:
+      continue
+    received += 1
+    state.parsers[event](data)
+  cpu = time.process_time() - start
+  gc.collect()
+  current, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  members = sum(len(guild.members) for guild in client.guilds)
+  print(f"{name:<8} {received:>9} {cpu:>8.2f} {current / 2**20:>11.1f} {peak / 2**20:>9.1f} "
+        f"{members:>9} {len(state._messages or []):>9}")
+  await client.close()
+
+
+async def main(args):
+  events = list(recorded(args.payloads) if args.payloads else generate(args))
+  print(f"{len(events)} payloads")
+  print(f"{'profile':<8} {'received':>9} {'cpu s':>8} {'cache MiB':>11} {'peak MiB':>9} "
+        f"{'members':>9} {'messages':>9}")
+  for name in args.profiles.split(","):
+    await replay(name, events, args)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--payloads", help="JSONL recorded with DISCORD_RECORD_PAYLOADS")
+  parser.add_argument("--guilds", type=int, default=5)
+  parser.add_argument("--members", type=int, default=5000)
+  parser.add_argument("--channels", type=int, default=20)
+  parser.add_argument("--events", type=int, default=50000)
+  parser.add_argument("--profiles", default="all,minimal")
+  parser.add_argument("--seed", type=int, default=1)
+  asyncio.run(main(parser.parse_args()))
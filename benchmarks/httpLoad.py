@@ -0,0 +1,44 @@
+#Requests/sec for /user/login and /LOGS against a running server, to compare
+#'python main.py' (Flask dev server) with 'uvicorn asgi:application --workers N'.
+#  python benchmarks/httpLoad.py --url http://127.0.0.1:1500 --threads 32 --seconds 10
+import argparse, threading, time
+import requests as req
+
+
+def worker(args, path, stop, counts, errors):
+  session = req.Session()
+  while not stop.is_set():
+    try:
+      if path == "/user/login":
+        #Unknown user: the full route, db lookup included, without a real pbkdf2 verify
+        x = session.post(f"{args.url}{path}", json={"name": "nobody", "user": "bench#0000", "password": "x"})
+      else:
+        x = session.get(f"{args.url}{path}", params={"limit": args.limit})
+        x.content
+      counts.append(x.status_code)
+    except req.RequestException:
+      errors.append(1)
+
+
+def run(args, path):
+  stop = threading.Event()
+  counts, errors = [], []
+  threads = [threading.Thread(target=worker, args=(args, path, stop, counts, errors)) for _ in range(args.threads)]
+  for thread in threads:
+    thread.start()
+  time.sleep(args.seconds)
+  stop.set()
+  for thread in threads:
+    thread.join()
+  print(f"{path:12} {len(counts) / args.seconds:8.1f} req/s  errors {len(errors)}")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--url", default="http://127.0.0.1:1500")
+  parser.add_argument("--threads", type=int, default=32)
+  parser.add_argument("--seconds", type=float, default=10)
+  parser.add_argument("--limit", type=int, default=100)
+  args = parser.parse_args()
+  run(args, "/user/login")
+  run(args, "/LOGS")
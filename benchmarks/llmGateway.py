@@ -0,0 +1,42 @@
+#Throughput of llmGateway with N users asking at once, against a local stub of the OpenAI
+#streaming API (no key or network needed).
+#  python benchmarks/llmGateway.py --users 50 --tokens 100
+import argparse, asyncio, os, sys, time
+from stubs import FakeDMChannel, openAIStub
+
+os.environ.setdefault("LLM_EDIT_INTERVAL", "0.2")
+
+
+async def main(args):
+  server = await openAIStub(args.tokens, args.tokenDelay)
+  os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/v1"
+  os.environ.setdefault("CHATGPT_KEY", "stub")
+  sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+  import llmGateway
+  llmGateway.key = os.environ["CHATGPT_KEY"]
+
+  dms = [FakeDMChannel() for _ in range(args.users)]
+  latencies = []
+
+  async def user(i):
+    start = time.perf_counter()
+    await llmGateway.reply(f"user{i}", "tell me something", dms[i])
+    latencies.append(time.perf_counter() - start)
+
+  start = time.perf_counter()
+  await asyncio.gather(*(user(i) for i in range(args.users)))
+  elapsed = time.perf_counter() - start
+  latencies.sort()
+  print(f"{args.users} users, concurrency {llmGateway.LLM_CONCURRENCY}: {args.users / elapsed:.1f} replies/sec")
+  print(f"p50 {latencies[len(latencies) // 2]:.2f}s  p99 {latencies[int(len(latencies) * 0.99)]:.2f}s  "
+        f"edits/reply {sum(dm.edits for dm in dms) / args.users:.1f}")
+  await llmGateway.client.close()
+  server.close()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--users", type=int, default=50)
+  parser.add_argument("--tokens", type=int, default=100)
+  parser.add_argument("--tokenDelay", type=float, default=0.01)
+  asyncio.run(main(parser.parse_args()))
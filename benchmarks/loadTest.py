@@ -0,0 +1,181 @@
+#Replays synthetic discord traffic through main.on_message with everything external stubbed:
+#mongomock (or a local mongod with --mongo), a local OpenAI streaming stub and the saved Billboard
+#page in fixtures/billboard. Reports messages/sec, p50/p99 handler latency per kind of message
+#and how late the event loop ran while it was going on.
+#  python benchmarks/loadTest.py --messages 5000 --mix chat=85,login=3,read=2,songs=5,prompt=5
+#  python benchmarks/loadTest.py --rate 500 --mongo mongodb://127.0.0.1:27017
+import argparse, asyncio, os, random, sys, time
+from stubs import FIXTURES, FakeAuthor, FakeMessage, openAIStub, serveDirectory
+
+ADMIN = "em57530"
+
+
+def parseMix(value):
+  #"chat=85,login=3" -> {"chat": 85.0, "login": 3.0}
+  mix = {}
+  for part in value.split(","):
+    kind, weight = part.split("=")
+    mix[kind.strip()] = float(weight)
+  return mix
+
+
+def traffic(args, users, admin):
+  #(kind, message) pairs in the order they are delivered
+  contents = {
+    "chat": lambda i: f"just chatting, message number {i}",
+    "login": lambda i: "%login-bench-password",
+    "read": lambda i: f"!read user{i % args.users}",
+    "songs": lambda i: f"?songs-{i % 50}-{i % 50 + 10}",
+    "prompt": lambda i: f"? tell me something about the number {i % args.prompts}",
+  }
+  mix = parseMix(args.mix)
+  unknown = set(mix) - set(contents)
+  if unknown:
+    raise SystemExit(f"Unknown traffic kinds: {', '.join(unknown)}")
+  random.seed(args.seed)
+  kinds = random.choices(list(mix), weights=list(mix.values()), k=args.messages)
+  for i, kind in enumerate(kinds):
+    author = admin if kind == "read" else users[i % len(users)]
+    yield kind, FakeMessage(author, contents[kind](i))
+
+
+def percentile(values, p):
+  if not values:
+    return 0.0
+  return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def sampleLag(interval, lags):
+  loop = asyncio.get_running_loop()
+  while True:
+    start = loop.time()
+    await asyncio.sleep(interval)
+    lags.append(max(0.0, loop.time() - start - interval))
+
+
+def seed(args, users, admin):
+  import authService, mongodb
+  if not args.mongo:
+    import mongomock
+    mongodb.client = mongomock.MongoClient()
+  else:
+    mongodb.getClient().drop_database(mongodb.getDatabase().name)
+  mongodb.ensureIndexes()
+  authService.register({"name": "bench", "password": "password"})
+  #Everyone starts logged in so the commands get past the session check
+  mongodb.signedInCollection().insert_many([{
+    "name": f"session{i}",
+    "user": str(author)
+  } for i, author in enumerate(users + [admin])])
+  mongodb.createLOGS([{
+    "displayName": f"user{i % args.users}",
+    "authorName": f"user{i % args.users}",
+    "msgContent": f"old message {i}",
+    "createAt": mongodb.parseDate("2023-10-01")
+  } for i in range(args.seedLogs)])
+
+
+async def main(args):
+  openAI = await openAIStub(args.tokens, args.tokenDelay)
+  billboard = serveDirectory(os.path.join(FIXTURES, "billboard"))
+  os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{openAI.sockets[0].getsockname()[1]}/v1"
+  os.environ["CHART_URL"] = f"http://127.0.0.1:{billboard.server_address[1]}/hot-100.html"
+  os.environ["CHART_TTL"] = str(args.chartTtl)
+  os.environ.setdefault("CHATGPT_KEY", "stub")
+  os.environ.setdefault("LOG_LEVEL", "WARNING")
+  if args.mongo:
+    os.environ["MONGODB_URI"] = args.mongo
+    os.environ["MONGODB_DB"] = "loadTest"
+  if not args.rateLimits:
+    #Synthetic users send far more than the real limits allow
+    for name in ["RATE_BROWSER", "RATE_LLM", "RATE_SCRAPE"]:
+      os.environ.setdefault(name, "1000000/1000000")
+  sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+  users = [FakeAuthor(f"user{i}") for i in range(args.users)]
+  admin = FakeAuthor(ADMIN)
+  seed(args, users, admin)
+  import main as bot
+  from passwordHasher import hasher
+  await bot.on_ready()
+  loop = asyncio.get_running_loop()
+  if not args.cold:
+    #Let on_ready finish importing the command modules, like a bot that has been up a while
+    await loop.run_in_executor(None, bot.importCommandModules)
+
+  lags = []
+  sampler = loop.create_task(sampleLag(args.lagInterval, lags))
+  latencies = {}
+  errors = {}
+  window = asyncio.Semaphore(args.concurrency)
+
+  async def deliver(kind, msg):
+    async with window:
+      start = time.perf_counter()
+      try:
+        await bot.on_message(msg)
+      except Exception:
+        errors[kind] = errors.get(kind, 0) + 1
+      latencies.setdefault(kind, []).append(time.perf_counter() - start)
+
+  tasks = []
+  begin = loop.time()
+  for i, (kind, msg) in enumerate(traffic(args, users, admin)):
+    if args.rate:
+      #Open loop: messages arrive on schedule whether or not earlier ones are done
+      delay = begin + i / args.rate - loop.time()
+      if delay > 0:
+        await asyncio.sleep(delay)
+    tasks.append(loop.create_task(deliver(kind, msg)))
+  await asyncio.gather(*tasks)
+  elapsed = loop.time() - begin
+  sampler.cancel()
+
+  print(f"{args.messages} messages in {elapsed:.2f}s: {args.messages / elapsed:.0f} msg/s "
+        f"(concurrency {args.concurrency}{f', offered {args.rate:.0f} msg/s' if args.rate else ''})")
+  print(f"{'kind':<8}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+  everything = []
+  for kind, values in sorted(latencies.items()):
+    values.sort()
+    everything += values
+    print(f"{kind:<8}{len(values):>8}{errors.get(kind, 0):>8}{percentile(values, 0.5) * 1000:>10.2f}"
+          f"{percentile(values, 0.99) * 1000:>10.2f}{values[-1] * 1000:>10.2f}")
+  everything.sort()
+  print(f"{'all':<8}{len(everything):>8}{sum(errors.values()):>8}{percentile(everything, 0.5) * 1000:>10.2f}"
+        f"{percentile(everything, 0.99) * 1000:>10.2f}{everything[-1] * 1000:>10.2f}")
+  lags.sort()
+  print(f"loop lag: p50 {percentile(lags, 0.5) * 1000:.2f} ms  p99 {percentile(lags, 0.99) * 1000:.2f} ms  "
+        f"max {(lags[-1] if lags else 0) * 1000:.2f} ms over {len(lags)} samples")
+
+  await bot.logWriter.close()
+  print(f"log writer: {bot.logWriter.stats}")
+  bot.loopLag.stop()
+  if "llmGateway" in sys.modules and sys.modules["llmGateway"].client is not None:
+    await sys.modules["llmGateway"].client.close()
+  hasher.shutdown()
+  openAI.close()
+  billboard.shutdown()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--messages", type=int, default=5000)
+  parser.add_argument("--mix", default="chat=85,login=3,read=2,songs=5,prompt=5")
+  parser.add_argument("--users", type=int, default=200)
+  parser.add_argument("--concurrency", type=int, default=100,
+                      help="messages being handled at once")
+  parser.add_argument("--rate", type=float, default=0,
+                      help="messages per second to offer, 0 sends as fast as they are handled")
+  parser.add_argument("--mongo", help="mongodb URI of a local mongod, mongomock when left out")
+  parser.add_argument("--seedLogs", type=int, default=10000)
+  parser.add_argument("--tokens", type=int, default=30, help="tokens per stub OpenAI reply")
+  parser.add_argument("--tokenDelay", type=float, default=0.005)
+  parser.add_argument("--prompts", type=int, default=20, help="distinct ? prompts")
+  parser.add_argument("--chartTtl", type=float, default=3600)
+  parser.add_argument("--lagInterval", type=float, default=0.01)
+  parser.add_argument("--rateLimits", action="store_true",
+                      help="keep the real RATE_* limits instead of lifting them")
+  parser.add_argument("--cold", action="store_true",
+                      help="start sending while the command modules are still being imported")
+  parser.add_argument("--seed", type=int, default=1)
+  asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,56 @@
+#Latency of every mongodb.QUERY_SHAPES query before and after ensureIndexes(), on a local mongod.
+#  python benchmarks/queryShapes.py --logs 200000
+#Uses its own database (dropped at the start) so it never touches the real one.
+import argparse, os, random, sys, time
+
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ["MONGODB_DB"] = "benchQueryShapes"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import mongodb
+
+
+def populate(logs, users):
+  mongodb.getClient().drop_database("benchQueryShapes")
+  batch = []
+  for i in range(logs):
+    author = random.randrange(users)
+    batch.append({
+      "displayName": f"user{author}",
+      "authorName": f"user{author}#0000",
+      "msgContent": f"message {i}",
+      "createAt": f"2023-10-{1 + i % 28:02d} 12:00:00+00:00"
+    })
+    if len(batch) == 10000:
+      mongodb.logsCollection().insert_many(batch)
+      batch = []
+  if batch:
+    mongodb.logsCollection().insert_many(batch)
+  mongodb.usersCollection().insert_many([{"name": f"user{i}", "password": "x"} for i in range(users)])
+  mongodb.signedInCollection().insert_many([{"name": f"user{i}", "user": f"user{i}#0000"} for i in range(users)])
+
+
+def timeShapes(repeat):
+  results = {}
+  for name, getCollection, query in mongodb.QUERY_SHAPES:
+    start = time.perf_counter()
+    for _ in range(repeat):
+      list(getCollection().find(query))
+    results[name] = (time.perf_counter() - start) / repeat * 1000
+  return results
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--logs", type=int, default=200000)
+  parser.add_argument("--users", type=int, default=5000)
+  parser.add_argument("--repeat", type=int, default=50)
+  args = parser.parse_args()
+
+  populate(args.logs, args.users)
+  before = timeShapes(args.repeat)
+  mongodb.ensureIndexes()
+  after = timeShapes(args.repeat)
+  report = mongodb.explainQueries()
+  for name in before:
+    print(f"{name:30} {before[name]:8.2f} ms -> {after[name]:8.2f} ms  {report[name]['stages']}")
+  mongodb.getClient().drop_database("benchQueryShapes")
@@ -0,0 +1,109 @@
+#relay.RelayController on the fake GPIO backend, no Pi needed:
+#  relays  - GPIO writes and time for a burst of relay commands, one write each against batched
+#  inputs  - time from an input edge to its event coming off the asyncio queue
+#  sonar   - readings per second and error of single pings against their median, with outliers
+#  python benchmarks/relayControl.py --commands 1000 --edges 2000 --seconds 3
+import argparse, asyncio, os, random, sys, time
+
+os.environ["GPIO_BACKEND"] = "fake"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import relay
+
+
+def controller(window, samples=5, interval=0.06):
+  gpio = relay.FakeGPIO()
+  control = relay.RelayController(gpio, window, samples, interval)
+  control.setup()
+  return gpio, control
+
+
+async def relays(args):
+  print(f"{'relays':<10}{'window ms':>10}{'changed':>10}{'writes':>10}{'ms':>10}")
+  for window in (0, args.window):
+    gpio, control = controller(window)
+    control.start(asyncio.get_running_loop(), sonar=False)
+    pins = list(control.outputs)
+    commands = [(random.choice(pins), random.choice([True, False, None])) for _ in range(args.commands)]
+    writes = gpio.writes
+    start = time.perf_counter()
+    if window:
+      #Commands arriving over a few batch windows, like a burst of !relay messages
+      for i in range(0, len(commands), args.burst):
+        await asyncio.gather(*[control.set(pin, on) for pin, on in commands[i:i + args.burst]])
+    else:
+      for pin, on in commands:
+        control.write([(pin, on)])
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0)
+    #The relay events queued are the changes that reached the pins
+    changed = control.events.qsize()
+    print(f"{'':<10}{window * 1000:>10.0f}{changed:>10}{gpio.writes - writes:>10}{elapsed * 1000:>10.1f}")
+
+
+async def inputs(args):
+  gpio, control = controller(0)
+  control.put(args.pin, "in")
+  control.start(asyncio.get_running_loop(), sonar=False)
+  latencies = []
+
+  def wiring():
+    #Edges from another thread, like RPi.GPIO's callback thread
+    for i in range(args.edges):
+      gpio.drive(args.pin, i % 2 == 0)
+      time.sleep(0.0005)
+
+  task = asyncio.get_running_loop().run_in_executor(None, wiring)
+  for _ in range(args.edges):
+    kind, pin, value, at = await control.events.get()
+    latencies.append(time.time() - at)
+  await task
+  latencies.sort()
+  print(f"inputs    {args.edges} edges, edge to consumer p50 {latencies[len(latencies) // 2] * 1e6:.0f} us "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f} us")
+
+
+async def sonar(args):
+  print(f"{'sonar':<10}{'samples':>10}{'readings/s':>12}{'error p50 cm':>14}{'error p99 cm':>14}")
+  for samples in (1, args.samples):
+    random.seed(args.seed)
+    gpio, control = controller(0, samples, args.interval)
+
+    def distance():
+      #A wall at args.distance cm, now and then a stray reflection
+      if random.random() < args.outliers:
+        return random.uniform(2, 400)
+      return args.distance + random.gauss(0, 1)
+
+    gpio.attachSonar(relay.U_TRIG, relay.U_ECHO, distance)
+    control.start(asyncio.get_running_loop())
+    readings = []
+    end = time.perf_counter() + args.seconds
+    while time.perf_counter() < end:
+      readings.append((await control.events.get())[2])
+    control.cleanup()
+    errors = sorted(abs(reading - args.distance) for reading in readings)
+    print(f"{'':<10}{samples:>10}{len(readings) / args.seconds:>12.1f}"
+          f"{errors[len(errors) // 2]:>14.1f}{errors[int(len(errors) * 0.99)]:>14.1f}")
+
+
+async def main(args):
+  random.seed(args.seed)
+  await relays(args)
+  await inputs(args)
+  await sonar(args)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--commands", type=int, default=1000)
+  parser.add_argument("--window", type=float, default=0.02)
+  parser.add_argument("--burst", type=int, default=100)
+  parser.add_argument("--edges", type=int, default=2000)
+  parser.add_argument("--pin", type=int, default=20)
+  parser.add_argument("--seconds", type=float, default=3)
+  parser.add_argument("--distance", type=float, default=100)
+  parser.add_argument("--outliers", type=float, default=0.1)
+  parser.add_argument("--samples", type=int, default=5)
+  parser.add_argument("--interval", type=float, default=0.01)
+  parser.add_argument("--seed", type=int, default=1)
+  asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,32 @@
+#?roblox checks against the stand-in pages in benchmarks/fixtures/roblox, served locally.
+#Needs Chrome and chromedriver; the first check per account logs in, the rest reuse its cookies.
+#  python benchmarks/robloxPool.py --checks 20 --accounts 3
+import argparse, asyncio, os, sys, time
+from stubs import FIXTURES, serveDirectory
+
+
+async def main(args):
+  server = serveDirectory(os.path.join(FIXTURES, "roblox"))
+  os.environ["ROBLOX_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+  sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+  import seleniumMine
+
+  async def check(i):
+    start = time.perf_counter()
+    notif = await seleniumMine.checkRobloxNotificationAsync(f"user{i % args.accounts}", "password")
+    return notif, time.perf_counter() - start
+
+  start = time.perf_counter()
+  results = await asyncio.gather(*(check(i) for i in range(args.checks)))
+  elapsed = time.perf_counter() - start
+  print(f"{args.checks} checks in {elapsed:.2f}s ({args.checks / elapsed:.2f}/s), "
+        f"workers {seleniumMine.BROWSER_WORKERS}, notifications {set(r[0] for r in results)}")
+  seleniumMine.pool.close()
+  server.shutdown()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--checks", type=int, default=20)
+  parser.add_argument("--accounts", type=int, default=3)
+  asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,118 @@
+#Query latency of the local inverted index (SEARCH_BACKEND=local) over a synthetic corpus, and
+#optionally of the mongodb text index (SEARCH_BACKEND=text) on a local mongod with the same
+#messages. Words are drawn from a Zipf distribution so there are very common and very rare ones.
+#  python benchmarks/search.py --messages 1000000
+#  python benchmarks/search.py --messages 200000 --mongo mongodb://127.0.0.1:27017
+import argparse, os, random, sys, time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import numpy as np
+from bson import ObjectId
+from searchIndex import SearchIndex
+
+
+def corpus(args):
+  rng = np.random.default_rng(args.seed)
+  vocabulary = [f"w{i}" for i in range(args.vocabulary)]
+  lengths = rng.integers(3, 25, args.messages)
+  words = (rng.zipf(1.3, lengths.sum()) - 1) % args.vocabulary
+  start = 0
+  now = datetime.now(timezone.utc)
+  for i, length in enumerate(lengths):
+    yield {
+      "_id": ObjectId(),
+      "displayName": f"user{i % args.authors}",
+      "authorName": f"user{i % args.authors}",
+      "msgContent": " ".join(vocabulary[w] for w in words[start:start + length]),
+      "createAt": now
+    }
+    start += length
+
+
+def queries(args):
+  #(kind, words, author) with words picked by how common they are
+  random.seed(args.seed)
+  common = lambda: f"w{random.randrange(5)}"
+  middle = lambda: f"w{random.randrange(50, 500)}"
+  rare = lambda: f"w{random.randrange(5000, args.vocabulary)}"
+  kinds = {
+    "common": lambda: (common(), None),
+    "middle": lambda: (middle(), None),
+    "rare": lambda: (rare(), None),
+    "common+middle": lambda: (f"{common()} {middle()}", None),
+    "3 words": lambda: (f"{common()} {middle()} {middle()}", None),
+    "by author": lambda: (common(), f"user{random.randrange(args.authors)}"),
+  }
+  return {kind: [make() for _ in range(args.queries)] for kind, make in kinds.items()}
+
+
+def timeQueries(search, workload):
+  print(f"{'query':<15}{'p50 ms':>10}{'p99 ms':>10}{'matches p50':>14}")
+  for kind, items in workload.items():
+    latencies, matches = [], []
+    for words, author in items:
+      start = time.perf_counter()
+      found = search(words, author)
+      latencies.append(time.perf_counter() - start)
+      matches.append(found)
+    latencies.sort()
+    matches.sort()
+    print(f"{kind:<15}{latencies[len(latencies) // 2] * 1000:>10.2f}"
+          f"{latencies[int(len(latencies) * 0.99)] * 1000:>10.2f}{matches[len(matches) // 2]:>14}")
+
+
+def indexBytes(index):
+  total = len(index.ids) + index.lengths.itemsize * len(index.lengths)
+  for docs, freqs in index.postings.values():
+    total += docs.itemsize * len(docs) + freqs.itemsize * len(freqs)
+  for docs in index.authors.values():
+    total += docs.itemsize * len(docs)
+  return total
+
+
+def main(args):
+  docs = list(corpus(args))
+  index = SearchIndex()
+  start = time.perf_counter()
+  index.addMany(docs)
+  elapsed = time.perf_counter() - start
+  print(f"local index: {len(index)} messages in {elapsed:.1f}s ({len(index) / elapsed:.0f}/s), "
+        f"{len(index.postings)} terms, {indexBytes(index) / 2**20:.0f} MiB of posting arrays")
+  workload = queries(args)
+
+  def local(words, author):
+    return index.search(words, author, 0, args.limit)[0]
+
+  timeQueries(local, workload)
+
+  if args.mongo:
+    os.environ["MONGODB_URI"] = args.mongo
+    os.environ["MONGODB_DB"] = "searchBenchmark"
+    os.environ["SEARCH_BACKEND"] = "text"
+    import mongodb
+    mongodb.getClient().drop_database("searchBenchmark")
+    start = time.perf_counter()
+    for i in range(0, len(docs), 10000):
+      mongodb.logsCollection().insert_many(docs[i:i + 10000], ordered=False)
+    mongodb.ensureIndexes()
+    print(f"\nmongodb text index: loaded and indexed in {time.perf_counter() - start:.1f}s")
+
+    def text(words, author):
+      return len(mongodb.searchLOGS(words, author, 0, args.limit)[0])
+
+    #Matches here is the page size, the text search doesn't count every match
+    timeQueries(text, workload)
+    mongodb.getClient().drop_database("searchBenchmark")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--messages", type=int, default=1000000)
+  parser.add_argument("--vocabulary", type=int, default=50000)
+  parser.add_argument("--authors", type=int, default=2000)
+  parser.add_argument("--queries", type=int, default=200)
+  parser.add_argument("--limit", type=int, default=20)
+  parser.add_argument("--mongo", help="also time the text index on this local mongod")
+  parser.add_argument("--seed", type=int, default=1)
+  main(parser.parse_args())
@@ -0,0 +1,109 @@
+#Local stand-ins shared by the benchmarks: a fake discord user/DM, a static file server for the
+#saved pages in fixtures/ and a stub of the OpenAI streaming API.
+import asyncio, functools, http.server, itertools, json, os, threading
+from datetime import datetime, timezone
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+#Discord ------------------------------------------------------------------------------------
+class FakeSent:
+  #What send() returns, the LLM gateway and purge jobs edit it
+
+  def __init__(self, channel):
+    self.channel = channel
+
+  async def edit(self, content=None, **kwargs):
+    self.channel.edits += 1
+
+
+class FakeDMChannel:
+
+  def __init__(self):
+    self.sends = 0
+    self.edits = 0
+    self.files = 0
+
+  async def send(self, content=None, file=None, **kwargs):
+    self.sends += 1
+    if file is not None:
+      self.files += 1
+    return FakeSent(self)
+
+
+class FakeAuthor:
+  ids = itertools.count(1)
+
+  def __init__(self, name, displayName=None):
+    self.name = name
+    self.display_name = displayName or name
+    self.id = next(FakeAuthor.ids)
+    self.dm = FakeDMChannel()
+
+  def __str__(self):
+    return self.name
+
+  async def send(self, content=None, **kwargs):
+    return await self.dm.send(content, **kwargs)
+
+
+class FakeMessage:
+  #Only what on_message and the command handlers read
+
+  def __init__(self, author, content):
+    self.author = author
+    self.content = content
+    self.created_at = datetime.now(timezone.utc)
+
+
+#Static pages ---------------------------------------------------------------------------------
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+
+  def log_message(self, *args):
+    pass
+
+
+def serveDirectory(directory):
+  #Serves directory on a free port from a background thread, returns the server
+  handler = functools.partial(QuietHandler, directory=directory)
+  server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server
+
+
+#OpenAI ---------------------------------------------------------------------------------------
+def chunk(content):
+  data = {
+    "id": "stub",
+    "object": "chat.completion.chunk",
+    "created": 0,
+    "model": "stub",
+    "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]
+  }
+  return f"data: {json.dumps(data)}\n\n"
+
+
+async def openAIStub(tokens, tokenDelay, port=0):
+  #Just enough HTTP/1.1 for /v1/chat/completions with stream=True, chunked and keep-alive
+  async def handle(reader, writer):
+    try:
+      while True:
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = 0
+        for line in head.decode().split("\r\n"):
+          if line.lower().startswith("content-length:"):
+            length = int(line.split(":")[1])
+        await reader.readexactly(length)
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ntransfer-encoding: chunked\r\n\r\n")
+        for i in range(tokens):
+          await asyncio.sleep(tokenDelay)
+          data = chunk(f"token{i} ").encode()
+          writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+          await writer.drain()
+        data = b"data: [DONE]\n\n"
+        writer.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(data), data))
+        await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+      writer.close()
+
+  return await asyncio.start_server(handle, "127.0.0.1", port)
@@ -0,0 +1,79 @@
+#Correcting a batch of logs through the old /updateLOG path (update_one then find_one per log),
+#one find_one_and_update per log (update) and one bulk write for the whole batch (updateMany),
+#on a local mongod. Counts the commands each sends, the round trips over a real connection.
+#  python benchmarks/updateLogs.py --items 10000
+#Uses its own database (dropped at the start) so it never touches the real one.
+import argparse, os, sys, time
+
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ["MONGODB_DB"] = "benchUpdateLogs"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from bson import ObjectId
+from pymongo import MongoClient, monitoring
+import mongodb
+
+
+class CommandCounter(monitoring.CommandListener):
+
+  def __init__(self):
+    self.count = 0
+
+  def started(self, event):
+    self.count += 1
+
+  def succeeded(self, event):
+    pass
+
+  def failed(self, event):
+    pass
+
+
+def populate(items):
+  mongodb.getClient().drop_database("benchUpdateLogs")
+  docs = [{
+    "displayName": f"user{i % 100}",
+    "authorName": f"user{i % 100}#0000",
+    "msgContent": f"message {i}",
+    "createAt": mongodb.parseDate("2023-10-01")
+  } for i in range(items)]
+  return [str(_id) for _id in mongodb.logsCollection().insert_many(docs).inserted_ids]
+
+
+def patches(ids, version):
+  return [{"_id": id, "msgContent": f"redacted {version}"} for id in ids]
+
+
+def oldUpdate(item):
+  #What mongodb.update did before: every field required, then a second query for the document
+  _id = ObjectId(item["_id"])
+  mongodb.logsCollection().update_one({"_id": _id}, {"$set": {"msgContent": item["msgContent"]}})
+  return mongodb.logsCollection().find_one({"_id": _id})
+
+
+def run(name, counter, apply):
+  counter.count = 0
+  start = time.perf_counter()
+  apply()
+  elapsed = time.perf_counter() - start
+  print(f"{name:<28}{elapsed:>10.2f}{counter.count:>12}")
+
+
+def main(args):
+  counter = CommandCounter()
+  mongodb.client = MongoClient(os.environ["MONGODB_URI"], event_listeners=[counter])
+  ids = populate(args.items)
+  print(f"{args.items} logs")
+  print(f"{'path':<28}{'seconds':>10}{'commands':>12}")
+  run("update_one + find_one", counter,
+      lambda: [oldUpdate(item) for item in patches(ids, 1)])
+  run("find_one_and_update", counter,
+      lambda: [mongodb.update(item) for item in patches(ids, 2)])
+  run("bulk_write", counter, lambda: mongodb.updateMany(patches(ids, 3)))
+  run("bulk_write + docs", counter, lambda: mongodb.updateMany(patches(ids, 4), returnDocs=True))
+  mongodb.getClient().drop_database("benchUpdateLogs")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--items", type=int, default=10000)
+  main(parser.parse_args())
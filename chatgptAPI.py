@@ -1,30 +1,175 @@
-import openai, os
-from dotenv import load_dotenv
+import logging, openai, time
+from collections import OrderedDict, deque
+from threading import Lock
+from responseCache import cache
+from config import config
+from metrics import externalCall
 
-load_dotenv()
+log = logging.getLogger(__name__)
 
-key = os.getenv("CHATGPT_KEY")
+key = config.get("CHATGPT_KEY")
 openai.api_key = key
-messages = [
-  {
-    "role": "system",
-    "content": "You are a kind helpful assistant"
-  },
-]
+system = {"role": "system", "content": "You are a kind helpful assistant"}
 
+#Conversations --------------------------------------------------------------------------------
+#Every discord user gets their own history. Old messages are folded into a short summary
+#so the prompt never goes over CHAT_TOKEN_BUDGET, and idle conversations get evicted.
+CHAT_TOKEN_BUDGET = int(config.get("CHAT_TOKEN_BUDGET", 3000))
+CHAT_SUMMARY_TOKENS = int(config.get("CHAT_SUMMARY_TOKENS", 300))
+CHAT_MAX_CONVERSATIONS = int(config.get("CHAT_MAX_CONVERSATIONS", 10000))
+CHAT_IDLE_SECONDS = float(config.get("CHAT_IDLE_SECONDS", 3600))
+CHAT_PERSIST = config.get("CHAT_PERSIST") == "1"
 
-def call(message):
-  print(message)
-  print("in message")
+try:
+  import tiktoken
+  encoding = tiktoken.get_encoding("cl100k_base")
+
+  def countTokens(text):
+    return len(encoding.encode(text))
+except ImportError:
+
+  def countTokens(text):
+    #Roughly 4 characters per token for english text
+    return len(text) // 4 + 1
+
+
+class Conversation:
+  #Every message and summary line is counted once, when it comes in, and the counts are kept
+  #next to them, so trimming only adds and subtracts
+
+  def __init__(self, summary="", messages=None):
+    self.messages = deque(messages or [])
+    self.counts = deque(countTokens(m["content"]) for m in self.messages)
+    self.messageTokens = sum(self.counts)
+    self.lines = deque()
+    self.summaryTokens = 0
+    self.addSummary(summary)
+    self.lastUsed = time.monotonic()
+
+  @property
+  def summary(self):
+    return "\n".join(line for line, _ in self.lines)
+
+  def tokens(self):
+    return self.messageTokens + self.summaryTokens
+
+  def isEmpty(self):
+    return not self.messages and not self.lines
+
+  def addSummary(self, text):
+    for line in text.split("\n"):
+      if line:
+        count = countTokens(line)
+        self.lines.append((line, count))
+        self.summaryTokens += count
+
+  def add(self, role, content):
+    self.messages.append({"role": role, "content": content})
+    self.counts.append(countTokens(content))
+    self.messageTokens += self.counts[-1]
+    self.lastUsed = time.monotonic()
+    self.trim()
+
+  def trim(self):
+    #Sliding window: the oldest messages leave the window and a clipped copy of them goes
+    #into the summary, which only keeps its newest CHAT_SUMMARY_TOKENS worth of lines
+    while self.tokens() > CHAT_TOKEN_BUDGET and len(self.messages) > 1:
+      oldest = self.messages.popleft()
+      self.messageTokens -= self.counts.popleft()
+      self.addSummary(f"{oldest['role']}: {oldest['content'][:200]}")
+      while len(self.lines) > 1 and self.summaryTokens > CHAT_SUMMARY_TOKENS:
+        self.summaryTokens -= self.lines.popleft()[1]
+
+  def prompt(self):
+    messages = [system]
+    if self.lines:
+      messages.append({
+        "role": "system",
+        "content": f"Summary of the earlier conversation:\n{self.summary}"
+      })
+    return messages + list(self.messages)
+
+
+class ConversationStore:
+
+  def __init__(self, maxConversations, idleSeconds):
+    self.maxConversations = maxConversations
+    self.idleSeconds = idleSeconds
+    self.conversations = OrderedDict()
+    self.lock = Lock()
+
+  def get(self, user):
+    #Loads from mongodb when CHAT_PERSIST is on, so async code calls it in an executor
+    with self.lock:
+      conversation = self.conversations.get(user)
+      if conversation is not None:
+        self.conversations.move_to_end(user)
+        return conversation
+    #Outside the lock, one user's find_one doesn't hold up everyone else's get
+    loaded = loadConversation(user) if CHAT_PERSIST else None
+    with self.lock:
+      #Another thread may have loaded the same user meanwhile, keep the first one
+      conversation = self.conversations.get(user) or loaded or Conversation()
+      self.conversations[user] = conversation
+      self.conversations.move_to_end(user)
+      self.evict()
+      return conversation
+
+  def evict(self):
+    #Least recently used first, both over the size limit and idle for too long
+    now = time.monotonic()
+    while self.conversations:
+      user, oldest = next(iter(self.conversations.items()))
+      idle = now - oldest.lastUsed >= self.idleSeconds
+      if len(self.conversations) <= self.maxConversations and not idle:
+        break
+      del self.conversations[user]
+
+  def save(self, user, conversation):
+    if CHAT_PERSIST:
+      saveConversation(user, conversation)
+
+
+def loadConversation(user):
+  from mongodb import conversationsCollection
+  doc = conversationsCollection().find_one({"_id": user})
+  if doc:
+    return Conversation(doc["summary"], doc["messages"])
+
+
+def saveConversation(user, conversation):
+  from mongodb import conversationsCollection
+  doc = {"summary": conversation.summary, "messages": list(conversation.messages)}
+  conversationsCollection().replace_one({"_id": user}, doc, upsert=True)
+
+
+conversations = ConversationStore(CHAT_MAX_CONVERSATIONS, CHAT_IDLE_SECONDS)
+
+
+@externalCall("openai")
+def complete(messages):
+  chat = openai.ChatCompletion.create(model="gpt-3.5-turbo",
+                                      messages=messages)
+  return chat.choices[0].message.content
+
+
+def call(message, user="default"):
+  log.debug("Prompt from %s: %s", user, message)
   try:
+    conversation = conversations.get(user)
+    #A reply only depends on the prompt alone at the start of a conversation, after that
+    #"yes" or "tell me more" mean something different for every user
+    cacheable = bool(message) and conversation.isEmpty()
     if message:
-      messages.append({"role": "user", "content": message}, )
-      chat = openai.ChatCompletion.create(model="gpt-3.5-turbo",
-                                          messages=messages)
-
-    reply = chat.choices[0].message.content
-    print(reply)
-    messages.append({"role": "assistant", "content": reply})
+      conversation.add("user", message)
+    reply = cache.get(message) if cacheable else None
+    if reply is None:
+      reply = complete(conversation.prompt())
+      if cacheable:
+        cache.put(message, reply)
+    log.debug("Reply to %s: %s", user, reply)
+    conversation.add("assistant", reply)
+    conversations.save(user, conversation)
     return reply
   except Exception as e:
-    return(e)
\ No newline at end of file
+    return(e)
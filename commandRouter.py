@@ -0,0 +1,114 @@
+import re, time
+from metrics import commandSeconds, commandsTotal
+
+#Verb is the run of letters right after the prefix: "%login-a-b" -> "login", "!deleteM" -> "deleteM"
+VERB = re.compile(r"[A-Za-z]*")
+
+
+class UsageError(Exception):
+  pass
+
+
+class Command:
+
+  def __init__(self, prefix, verb, handler, args, sep, auth, limit):
+    self.prefix = prefix
+    self.verb = verb
+    self.handler = handler
+    #Names ending in ? are optional, the last argument gets whatever is left over
+    self.args = args
+    self.required = len([arg for arg in args if not arg.endswith("?")])
+    self.sep = sep
+    self.auth = auth
+    #Rate limit / concurrency class, see rateLimiter.Governor
+    self.limit = limit
+
+  def usage(self):
+    args = self.sep.join(f"[{arg[:-1]}]" if arg.endswith("?") else f"<{arg}>"
+                         for arg in self.args)
+    return f"Usage: {self.prefix}{self.verb}{self.sep if args else ''}{args}"
+
+  def parseArgs(self, rest):
+    #A space separator also accepts runs of whitespace
+    sep = None if self.sep == " " else self.sep
+    rest = rest.strip() if sep is None else rest.lstrip(sep)
+    parts = rest.split(sep, len(self.args) - 1) if rest and self.args else []
+    if len(parts) < self.required:
+      raise UsageError(self.usage())
+    return {arg.rstrip("?"): value for arg, value in zip(self.args, parts)}
+
+
+#Command router ---------------------------------------------------------------------------------
+#Commands are registered per (prefix, verb) and found with one dict lookup. Only commands
+#registered with auth=True pay for the login check, and messages that don't start with a
+#prefix return straight away. Commands with a limit class run through the governor.
+class CommandRouter:
+
+  def __init__(self, governor=None):
+    self.governor = governor
+    self.commands = {}
+    #Handler for a prefix when the verb isn't a registered command (? goes to chatgpt)
+    self.fallbacks = {}
+    self.prefixes = set()
+
+  def command(self, prefix, verb, args=(), sep=" ", auth=False, limit=None):
+
+    def register(handler):
+      self.commands[(prefix, verb)] = Command(prefix, verb, handler, list(args),
+                                              sep, auth, limit)
+      self.prefixes.add(prefix)
+      return handler
+
+    return register
+
+  def fallback(self, prefix, args=(), sep=" ", auth=False, limit=None):
+
+    def register(handler):
+      self.fallbacks[prefix] = Command(prefix, "", handler, list(args), sep,
+                                       auth, limit)
+      self.prefixes.add(prefix)
+      return handler
+
+    return register
+
+  def find(self, content):
+    #Returns (command, rest of the message) or (None, None)
+    if not content or content[0] not in self.prefixes:
+      return None, None
+    verb = VERB.match(content, 1).group()
+    command = self.commands.get((content[0], verb))
+    if command is not None:
+      return command, content[1 + len(verb):]
+    command = self.fallbacks.get(content[0])
+    if command is not None:
+      return command, content[1:]
+    return None, None
+
+  async def dispatch(self, msg, content, authorized):
+    #authorized is an async function(msg) -> bool, only called for auth commands
+    command, rest = self.find(content)
+    if command is None:
+      return False
+    name = command.prefix + command.verb
+    if command.auth and not await authorized(msg):
+      commandsTotal.inc(name, "denied")
+      return False
+    try:
+      args = command.parseArgs(rest)
+    except UsageError as e:
+      commandsTotal.inc(name, "usage")
+      await msg.author.send(str(e))
+      return True
+    start = time.perf_counter()
+    try:
+      if command.limit and self.governor:
+        await self.governor.run(msg, command.limit, command.handler, args)
+      else:
+        await command.handler(msg, **args)
+    except Exception:
+      commandsTotal.inc(name, "error")
+      raise
+    finally:
+      commandSeconds.observe(time.perf_counter() - start, name)
+    commandsTotal.inc(name, "ok")
+    return True
@@ -0,0 +1,58 @@
+import atexit, json, logging, os, queue
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+
+#Config -------------------------------------------------------------------------------------------
+#The .env is loaded once, here, and every module reads its settings through this object
+class Config:
+
+  def __init__(self):
+    load_dotenv()
+    setupLogging(self.get("LOG_LEVEL", "INFO"), self.get("LOG_FORMAT", "text"))
+
+  def get(self, name, default=None):
+    return os.environ.get(name, default)
+
+
+#Logging ------------------------------------------------------------------------------------------
+#Every module logs with logging.getLogger(__name__). LOG_LEVEL picks the level (DEBUG, INFO,
+#WARNING, ERROR) or OFF to turn logging off, LOG_FORMAT=json writes one JSON object per line.
+#Records are handed to a queue and written by a background thread, so the event loop never
+#waits on stdout.
+class JSONFormatter(logging.Formatter):
+
+  def format(self, record):
+    entry = {
+      "time": self.formatTime(record),
+      "level": record.levelname,
+      "logger": record.name,
+      "message": record.getMessage()
+    }
+    if record.exc_info:
+      entry["exception"] = self.formatException(record.exc_info)
+    return json.dumps(entry)
+
+
+def setupLogging(level, format="text"):
+  root = logging.getLogger()
+  if level.upper() == "OFF":
+    logging.disable(logging.CRITICAL)
+    return
+  handler = logging.StreamHandler()
+  if format == "json":
+    handler.setFormatter(JSONFormatter())
+  else:
+    handler.setFormatter(
+      logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+  records = queue.SimpleQueue()
+  listener = QueueListener(records, handler)
+  listener.start()
+  atexit.register(listener.stop)
+  root.addHandler(QueueHandler(records))
+  root.setLevel(level.upper())
+  #httpx logs every OpenAI request at INFO
+  logging.getLogger("httpx").setLevel(max(root.level, logging.WARNING))
+
+
+config = Config()
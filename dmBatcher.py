@@ -0,0 +1,95 @@
+import asyncio, io, itertools
+import discord
+
+MESSAGE_LIMIT = 2000
+#Discord's upload limit for bots without boosts
+ATTACHMENT_LIMIT = 8 * 1024 * 1024
+
+
+#DM batching --------------------------------------------------------------------------------
+#Instead of one DM per line, lines are packed into as few 2000 char messages as possible.
+#After maxMessages messages the rest of the output is sent as one text file.
+async def aiterate(lines):
+  if hasattr(lines, "__aiter__"):
+    async for line in lines:
+      yield line
+  else:
+    for line in lines:
+      yield line
+
+
+async def packLines(lines, limit=MESSAGE_LIMIT):
+  #lines can be a list, a generator or an async generator (like iterateCursor)
+  chunk, size = [], 0
+  async for line in aiterate(lines):
+    #A single line longer than a message gets cut into message sized pieces
+    while len(line) > limit:
+      if chunk:
+        yield "\n".join(chunk)
+        chunk, size = [], 0
+      yield line[:limit]
+      line = line[limit:]
+    extra = len(line) + (1 if chunk else 0)
+    if size + extra > limit:
+      yield "\n".join(chunk)
+      chunk, size, extra = [], 0, len(line)
+    chunk.append(line)
+    size += extra
+  if chunk:
+    yield "\n".join(chunk)
+
+
+async def iterateCursor(cursor, batchSize=500):
+  #pymongo blocks while it fetches the next batch, so that part runs in a thread
+  loop = asyncio.get_running_loop()
+  while True:
+    batch = await loop.run_in_executor(
+      None, lambda: list(itertools.islice(cursor, batchSize)))
+    if not batch:
+      return
+    for doc in batch:
+      yield doc
+
+
+async def sendLines(destination,
+                    lines,
+                    header=None,
+                    maxMessages=5,
+                    filename="output.txt"):
+  if header:
+    lines = withHeader(header, lines)
+  chunks = packLines(lines)
+  sent = 0
+  inflight = None
+  overflow = None
+  async for content in chunks:
+    if sent == maxMessages:
+      overflow = content
+      break
+    #One send in flight while the next chunk is packed. discord.py already waits for the
+    #channel's rate limit bucket, so more than one at a time wouldn't go out any faster
+    if inflight:
+      await inflight
+    inflight = asyncio.create_task(destination.send(content))
+    sent += 1
+  if inflight:
+    await inflight
+  if overflow is None:
+    return sent
+
+  data = io.BytesIO()
+  data.write((overflow + "\n").encode())
+  async for content in chunks:
+    if data.tell() >= ATTACHMENT_LIMIT:
+      break
+    data.write((content + "\n").encode())
+  data.seek(0)
+  await destination.send("The rest didn't fit in messages:",
+                         file=discord.File(data, filename=filename))
+  return sent + 1
+
+
+async def withHeader(header, lines):
+  yield header
+  async for line in aiterate(lines):
+    yield line
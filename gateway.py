@@ -0,0 +1,84 @@
+import json, logging, discord
+from config import config
+
+log = logging.getLogger(__name__)
+
+
+#Gateway profile ----------------------------------------------------------------------------
+#on_message only needs message events and their content, from servers and DMs. With
+#DISCORD_INTENTS=minimal (the default) discord doesn't send member, presence or typing events
+#at all, and the member and message caches stay empty. DISCORD_INTENTS=all is the old
+#behaviour, or it can be a list of intent names like guilds,guild_messages,members.
+MINIMAL_INTENTS = ["guilds", "guild_messages", "dm_messages", "message_content"]
+
+
+def buildIntents(profile):
+  if profile == "all":
+    return discord.Intents.all()
+  names = MINIMAL_INTENTS if profile == "minimal" else [
+    name.strip() for name in profile.split(",")
+  ]
+  intents = discord.Intents.none()
+  for name in names:
+    if name not in discord.Intents.VALID_FLAGS:
+      raise ValueError(f"Unknown intent {name}")
+    setattr(intents, name, True)
+  return intents
+
+
+def buildMemberCacheFlags(policy, intents):
+  #"none" keeps no members, "intents" keeps what the intents allow (discord.py's default)
+  if policy == "none":
+    return discord.MemberCacheFlags.none()
+  if policy == "intents":
+    return discord.MemberCacheFlags.from_intents(intents)
+  raise ValueError(f"Unknown member cache policy {policy}")
+
+
+def clientOptions():
+  intents = buildIntents(config.get("DISCORD_INTENTS", "minimal"))
+  #Messages only matter while on_message runs, 0 turns the message cache off
+  maxMessages = int(config.get("DISCORD_MAX_MESSAGES", 0))
+  return {
+    "intents": intents,
+    "member_cache_flags": buildMemberCacheFlags(
+      config.get("DISCORD_MEMBER_CACHE", "none"), intents),
+    "max_messages": maxMessages or None,
+    "chunk_guilds_at_startup": False,
+    "enable_debug_events": bool(config.get("DISCORD_RECORD_PAYLOADS")),
+  }
+
+
+def buildClient():
+  #DISCORD_SHARDED=1 uses AutoShardedClient. Several processes can split the guilds by giving
+  #each the same DISCORD_SHARD_COUNT and its own DISCORD_SHARD_IDS (0,1 / 2,3 ...).
+  options = clientOptions()
+  if config.get("DISCORD_SHARDED") != "1":
+    client = discord.Client(**options)
+  else:
+    shardCount = config.get("DISCORD_SHARD_COUNT")
+    shardIds = config.get("DISCORD_SHARD_IDS")
+    if shardIds and not shardCount:
+      raise ValueError("DISCORD_SHARD_IDS needs DISCORD_SHARD_COUNT")
+    if shardCount:
+      options["shard_count"] = int(shardCount)
+    if shardIds:
+      options["shard_ids"] = [int(shard) for shard in shardIds.split(",")]
+    client = discord.AutoShardedClient(**options)
+  if config.get("DISCORD_RECORD_PAYLOADS"):
+    recordPayloads(client, config.get("DISCORD_RECORD_PAYLOADS"))
+  return client
+
+
+def recordPayloads(client, path):
+  #Appends every dispatch the gateway sends as {"t": event, "d": data} lines, the input of
+  #benchmarks/gatewayMemory.py. For capturing a sample only, it writes on the event loop.
+  file = open(path, "a", buffering=1)
+  log.warning("Recording gateway payloads to %s", path)
+
+  async def on_socket_raw_receive(raw):
+    payload = json.loads(raw)
+    if payload.get("op") == 0:
+      file.write(json.dumps({"t": payload["t"], "d": payload["d"]}) + "\n")
+
+  client.event(on_socket_raw_receive)
@@ -0,0 +1,127 @@
+import asyncio, time
+import httpx
+from openai import AsyncOpenAI
+from chatgptAPI import conversations, key
+from responseCache import cache
+from dmBatcher import sendLines
+from config import config
+from metrics import externalSeconds, externalErrors
+
+#LLM gateway ----------------------------------------------------------------------------------
+#Async replacement for chatgptAPI.call used by the ? command. Completions are streamed into one
+#DM that gets edited as tokens arrive, at most LLM_CONCURRENCY run at once, and a user sending a
+#new prompt cancels their previous one (the same prompt twice just waits for the first).
+LLM_MODEL = config.get("LLM_MODEL", "gpt-3.5-turbo")
+LLM_CONCURRENCY = int(config.get("LLM_CONCURRENCY", 8))
+LLM_TIMEOUT = float(config.get("LLM_TIMEOUT", 60))
+#Discord allows 5 edits per 5 seconds on a message
+LLM_EDIT_INTERVAL = float(config.get("LLM_EDIT_INTERVAL", 1.0))
+MESSAGE_LIMIT = 2000
+
+client = None
+semaphore = None
+#user -> (prompt, task) for the reply that is currently running
+inflight = {}
+
+
+def getClient():
+  #Created on first use, inside the loop that will use its connection pool
+  global client, semaphore
+  if client is None:
+    client = AsyncOpenAI(
+      api_key=key,
+      base_url=config.get("OPENAI_BASE_URL"),
+      timeout=LLM_TIMEOUT,
+      http_client=httpx.AsyncClient(limits=httpx.Limits(
+        max_connections=LLM_CONCURRENCY,
+        max_keepalive_connections=LLM_CONCURRENCY)))
+    semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+  return client
+
+
+async def stream(messages):
+  llm = getClient()
+  async with semaphore:
+    #Timed from the request to the last token, waiting for the semaphore doesn't count
+    start = time.perf_counter()
+    try:
+      response = await llm.chat.completions.create(model=LLM_MODEL,
+                                                   messages=messages,
+                                                   stream=True)
+      async for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+          yield chunk.choices[0].delta.content
+    except Exception:
+      externalErrors.inc("openai")
+      raise
+    finally:
+      externalSeconds.observe(time.perf_counter() - start, "openai")
+
+
+async def streamToDM(destination, messages):
+  #Sends one message and keeps editing it, starting a new one every 2000 characters
+  loop = asyncio.get_running_loop()
+  message = await destination.send("...")
+  text = ""
+  start = 0
+  lastEdit = loop.time()
+  try:
+    async for token in stream(messages):
+      text += token
+      while len(text) - start > MESSAGE_LIMIT:
+        await message.edit(content=text[start:start + MESSAGE_LIMIT])
+        start += MESSAGE_LIMIT
+        message = await destination.send(text[start:start + MESSAGE_LIMIT] or "...")
+        lastEdit = loop.time()
+      if loop.time() - lastEdit >= LLM_EDIT_INTERVAL:
+        await message.edit(content=text[start:])
+        lastEdit = loop.time()
+  except asyncio.CancelledError:
+    await message.edit(content=(text[start:] + " (cancelled)")[-MESSAGE_LIMIT:])
+    raise
+  await message.edit(content=text[start:] or "(empty reply)")
+  return text
+
+
+async def answer(user, prompt, destination):
+  loop = asyncio.get_running_loop()
+  #With CHAT_PERSIST the first prompt of a user reads their conversation from mongodb
+  conversation = await loop.run_in_executor(None, conversations.get, user)
+  #Only a first prompt is answered from (and saved to) the cache, later replies depend on the
+  #user's own conversation
+  cacheable = conversation.isEmpty()
+  conversation.add("user", prompt)
+  reply = cache.get(prompt) if cacheable else None
+  if reply is None:
+    reply = await streamToDM(destination, conversation.prompt())
+    if cacheable:
+      cache.put(prompt, reply)
+  else:
+    await sendLines(destination, reply.split("\n"))
+  conversation.add("assistant", reply)
+  await loop.run_in_executor(None, conversations.save, user, conversation)
+  return reply
+
+
+async def reply(user, prompt, destination):
+  running = inflight.get(user)
+  if running and not running[1].done():
+    if running[0] == prompt:
+      #Same question again while the first one is still streaming
+      return await asyncio.shield(running[1])
+    running[1].cancel()
+  task = asyncio.get_running_loop().create_task(
+    answer(user, prompt, destination))
+  inflight[user] = (prompt, task)
+  try:
+    return await task
+  except asyncio.CancelledError:
+    if task.cancelled():
+      #Replaced by a newer prompt from the same user
+      return None
+    raise
+  except Exception as e:
+    await destination.send(f"ChatGPT failed: {e}")
+  finally:
+    if inflight.get(user, (None, None))[1] is task:
+      del inflight[user]
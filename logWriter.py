@@ -0,0 +1,106 @@
+import asyncio, logging
+from mongodb import createLOGS
+
+log = logging.getLogger(__name__)
+#Queued by close(), the flusher stops when it gets here
+STOP = object()
+
+
+#Batched log writer -------------------------------------------------------------------------
+#on_message only does a queue put, the flusher task writes the logs with insert_many
+class LogWriter:
+
+  def __init__(self,
+               maxQueue=10000,
+               batchSize=500,
+               flushInterval=1.0,
+               whenFull="drop"):
+    self.queue = asyncio.Queue(maxsize=maxQueue)
+    self.batchSize = batchSize
+    self.flushInterval = flushInterval
+    #"drop" counts and discards the log, "block" makes on_message wait for space
+    self.whenFull = whenFull
+    self.task = None
+    self.stats = {
+      "queued": 0,
+      "written": 0,
+      "dropped": 0,
+      "failed": 0,
+      "flushes": 0
+    }
+
+  def start(self):
+    #on_ready can fire again after a reconnect so only start one flusher
+    if self.task is None or self.task.done():
+      self.task = asyncio.get_running_loop().create_task(self.flusher())
+
+  async def put(self, item):
+    if self.whenFull == "block":
+      await self.queue.put(item)
+    else:
+      try:
+        self.queue.put_nowait(item)
+      except asyncio.QueueFull:
+        self.stats["dropped"] += 1
+        return False
+    self.stats["queued"] += 1
+    return True
+
+  async def flusher(self):
+    loop = asyncio.get_running_loop()
+    while True:
+      item = await self.queue.get()
+      if item is STOP:
+        return
+      batch = [item]
+      stopping = False
+      deadline = loop.time() + self.flushInterval
+      #Fill the batch until it is full or the flush interval runs out
+      while len(batch) < self.batchSize:
+        try:
+          item = self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+          timeout = deadline - loop.time()
+          if timeout <= 0:
+            break
+          try:
+            item = await asyncio.wait_for(self.queue.get(), timeout)
+          except asyncio.TimeoutError:
+            break
+        if item is STOP:
+          stopping = True
+          break
+        batch.append(item)
+      #The batch it was filling when close() was called gets written too
+      await self.write(batch)
+      if stopping:
+        return
+
+  async def write(self, batch):
+    #pymongo is blocking so the insert runs in the default thread pool
+    loop = asyncio.get_running_loop()
+    try:
+      written = await loop.run_in_executor(None, createLOGS, batch)
+    except Exception as e:
+      log.error("Log flush failed: %s", e)
+      written = 0
+    self.stats["flushes"] += 1
+    self.stats["written"] += written
+    self.stats["failed"] += len(batch) - written
+
+  async def close(self):
+    #STOP goes in behind the waiting logs, so the flusher writes them all before it returns
+    if self.task is not None and not self.task.done():
+      await self.queue.put(STOP)
+      await self.task
+    self.task = None
+    #Only logs put after STOP (or everything, if the flusher never ran) are left here
+    batch = []
+    while not self.queue.empty():
+      batch.append(self.queue.get_nowait())
+      if len(batch) == self.batchSize:
+        await self.write(batch)
+        batch = []
+    if batch:
+      await self.write(batch)
+    log.info("Log writer closed: %s", self.stats)
@@ -1,43 +1,108 @@
-from flask import Flask, request, render_template
-from mongodb import update, read, createLOG, deleteLOGS, readLOGS, check
-import os, asyncio, json, discord
-import requests as req
-from chatgptAPI import call
-from webscrapper import getSongs
+from flask import Flask, Response, g, request, render_template
+from mongodb import (update, updateMany, pageLOGS, ndjson, readLOGS, searchLOGS, watchSessions,
+                     buildIndexes, startSearchIndex, repairActivity)
+import asyncio, importlib, logging, subprocess, sys, time
+import authService, gateway
 from threading import Thread
 from user.models import User
-from seleniumMine import checkRobloxNotification
-from dotenv import load_dotenv
-from pymongo import MongoClient
+from logWriter import LogWriter
+from purgeJobs import PurgeJobs
+from dmBatcher import sendLines, iterateCursor
+from commandRouter import CommandRouter
+from rateLimiter import Governor, makeBackend, limitsFromEnv
+from bson import json_util
+from bson.errors import InvalidId
+from searchTerms import SearchNotReady
+from config import config
+from metrics import registry, httpSeconds, LoopLagMonitor, CONTENT_TYPE
+from mongodb import sessionCache
+from passwordHasher import hasher
+
+log = logging.getLogger(__name__)
 
-#To load the .env---------------------------------------------------------------------------
-load_dotenv()
 
 #Go to QAuth2 -> URL Generator, then click bot
-DiscordToken = os.getenv("DISCORDBOT_KEY")
-print(DiscordToken)
-Flask_key = os.getenv("FLASK_KEY")
-print(Flask_key)
-intents = discord.Intents.all()
-intents.message_content = True
-client = discord.Client(
-  intents=intents)  #The intents on the right is the variable we made
+DiscordToken = config.get("DISCORDBOT_KEY")
+Flask_key = config.get("FLASK_KEY")
+#Only the intents and caches on_message needs, see gateway.py for the DISCORD_* settings
+client = gateway.buildClient()
+
+#Outputs needing more DMs than this are sent as a text file
+DM_MAX_MESSAGES = int(config.get("DM_MAX_MESSAGES", 5))
+DATE_HELP = "Dates must look like 2023-10-01 or 2023-10-01T12:00"
+#How many matches !search sends back
+SEARCH_DM_RESULTS = int(config.get("SEARCH_DM_RESULTS", 50))
+
+#Messages are logged in batches instead of one insert_one per message
+logWriter = LogWriter(maxQueue=int(config.get("LOG_QUEUE_SIZE", 10000)),
+                      batchSize=int(config.get("LOG_BATCH_SIZE", 500)),
+                      flushInterval=float(config.get("LOG_FLUSH_INTERVAL", 1.0)),
+                      whenFull=config.get("LOG_QUEUE_FULL", "drop"))
+
+#!deleteM and !deleteP run as background jobs that delete in chunks
+purgeJobs = PurgeJobs(client,
+                      batchSize=int(config.get("PURGE_BATCH_SIZE", 500)),
+                      pause=float(config.get("PURGE_PAUSE", 0.5)),
+                      editInterval=float(config.get("PURGE_EDIT_INTERVAL", 2.0)),
+                      concurrency=int(config.get("PURGE_CONCURRENCY", 1)))
+
+#Metrics, see metrics.py and /metrics
+loopLag = LoopLagMonitor(interval=float(config.get("LOOP_LAG_INTERVAL", 0.5)))
+registry.gauge("event_loop_lag_last_seconds", "Lag of the last loop lag sample",
+               lambda: loopLag.last)
+registry.gauge("log_queue_size", "Logs waiting to be written",
+               lambda: logWriter.queue.qsize())
+registry.gauge("logs_written_total", "Logs written by the log writer",
+               lambda: logWriter.stats["written"])
+registry.gauge("logs_dropped_total", "Logs dropped because the queue was full",
+               lambda: logWriter.stats["dropped"])
+registry.gauge("session_cache_size", "Entries in the session cache",
+               lambda: sessionCache.stats()["size"])
+registry.gauge("session_cache_hit_rate", "Share of session checks answered by the cache",
+               lambda: sessionCache.stats()["hitRate"])
+for point in ("p50", "p90", "p99"):
+  registry.gauge(f"password_hash_{point}_seconds",
+                 f"{point} of the last password hashes and checks",
+                 lambda point=point: hasher.stats()[point])
+registry.gauge("password_hash_pending", "Password hashes and checks waiting or running",
+               lambda: hasher.stats()["pending"])
+registry.gauge("password_hash_rejected_total", "Password checks turned away as busy",
+               lambda: hasher.stats()["rejected"])
+
+
+def responseCacheStats():
+  #responseCache (and NumPy) load with the ? command, not at startup
+  from responseCache import cache
+  return cache.stats()
+
+
+registry.gauge("response_cache_size", "Entries in the chat response cache",
+               lambda: responseCacheStats()["size"])
+registry.gauge("response_cache_hit_rate", "Share of cacheable prompts answered by the response cache",
+               lambda: responseCacheStats()["hitRate"])
+
+
+async def runDiscord():
+  #Used by the thread below and by asgi.py, which runs it as a task in one worker
+  try:
+    await client.start(DiscordToken)
+  finally:
+    loopLag.stop()
+    await logWriter.close()
 
 
 class async_discord_thread(Thread):
 
   def __init__(self):
     Thread.__init__(self)
-    self.loop = asyncio.get_event_loop()
+    #Its own loop, not the main thread's
+    self.loop = asyncio.new_event_loop()
     self.start()
 
-  async def starter(self):
-    await client.start(DiscordToken)
-
   def run(self):
     self.name = 'Discord.py'
-    self.loop.create_task(self.starter())
-    self.loop.run_forever()
+    asyncio.set_event_loop(self.loop)
+    self.loop.run_until_complete(runDiscord())
 
 
 #Discord code----------------------------------------------------------------------------------
@@ -45,7 +110,271 @@ class async_discord_thread(Thread):
 
 @client.event
 async def on_ready():  #Look into async def #Needs to be called on_ready
-  print(f"{client.user} ta rodando!")
+  logWriter.start()
+  loopLag.start()
+  asyncio.get_running_loop().run_in_executor(None, importCommandModules)
+  await purgeJobs.resume()
+  if RELAY_ENABLED:
+    startRelay()
+  log.info("%s ta rodando!", client.user)
+
+
+#Commands -------------------------------------------------------------------------------------
+#The modules behind ?songs, ?roblox, ? and !stats (bs4, selenium, openai, numpy) are not imported
+#when the bot starts. on_ready imports them in a thread, so the first command doesn't hold up the
+#event loop while they load, and the handlers import them again (for free) when they run.
+COMMAND_MODULES = ["webscrapper", "seleniumMine", "llmGateway", "analytics"]
+
+
+def importCommandModules():
+  for module in COMMAND_MODULES:
+    try:
+      importlib.import_module(module)
+    except Exception as e:
+      log.warning("Could not import %s: %s", module, e)
+
+
+#Per user token buckets and per class concurrency caps for the expensive commands
+router = CommandRouter(governor=Governor(makeBackend(), limitsFromEnv()))
+ADMIN = "em57530"
+#!relay and !distance drive the pins of the Pi the bot runs on (GPIO_BACKEND=fake without one)
+RELAY_ENABLED = config.get("RELAY_ENABLED") == "1"
+RELAY_ACTIONS = {"on": True, "off": False, "toggle": None}
+
+
+@router.command("%", "register", args=["name", "password"], sep="-")
+async def registerCommand(msg, name, password):
+  userJson = {"name": str(name), "password": str(password)}
+  result = (await authService.registerAsync(userJson))[0]
+  if "error" in result:
+    await msg.author.send(result["error"])
+  else:
+    await msg.author.send("Succesfully created User")
+
+
+@router.command("%", "login", args=["name", "password"], sep="-")
+async def loginCommand(msg, name, password):
+  loginDic = {"name": name, "user": str(msg.author), "password": password}
+  result = (await authService.loginAsync(loginDic))[0]
+  if "error" in result.keys():
+    await msg.author.send(result["error"])
+  else:
+    await msg.author.send(result["result"])
+
+
+@router.command("%", "logout")
+async def logoutCommand(msg):
+  result = (await authService.logoutAsync({"user": str(msg.author)}))[0]
+  await msg.author.send(result["result"])
+
+
+async def startPurge(msg, displayName, since, until):
+  try:
+    jobId = await purgeJobs.start(displayName, since, until, msg.author)
+  except ValueError:
+    await msg.author.send(DATE_HELP)
+    return
+  await msg.author.send(
+    f"Started purge {jobId}, stop it with !cancelPurge {jobId}")
+
+
+#Optional time window after the delete/read commands: !deleteM 2023-10-01 2023-11-01
+@router.command("!", "deleteM", args=["since?", "until?"], auth=True)
+async def deleteMineCommand(msg, since=None, until=None):
+  await startPurge(msg, msg.author.display_name, since, until)
+
+
+@router.command("!", "deleteP", args=["name", "since?", "until?"], auth=True)
+async def deletePersonCommand(msg, name, since=None, until=None):
+  if str(msg.author) != ADMIN:
+    await msg.author.send("Must be admin to use this command!")
+    return
+  await startPurge(msg, name, since, until)
+
+
+@router.command("!", "cancelPurge", args=["jobId"], auth=True)
+async def cancelPurgeCommand(msg, jobId):
+  await msg.author.send(
+    purgeJobs.cancel(jobId, msg.author, admin=str(msg.author) == ADMIN))
+
+
+@router.command("!", "read", args=["name", "since?", "until?"], auth=True)
+async def readCommand(msg, name, since=None, until=None):
+  if str(msg.author) != ADMIN:
+    return
+  try:
+    readItems = (readLOGS(name, since, until))
+  except ValueError:
+    await msg.author.send(DATE_HELP)
+    return
+  lines = (f"Item: {el['msgContent']}" async for el in iterateCursor(readItems))
+  await sendLines(msg.author,
+                  lines,
+                  header=f"Items by {name}",
+                  maxMessages=DM_MAX_MESSAGES,
+                  filename=f"{name}.txt")
+
+
+#Everyone searches their own messages, the admin searches everybody's
+@router.command("!", "search", args=["terms"], auth=True)
+async def searchCommand(msg, terms):
+  author = None if str(msg.author) == ADMIN else str(msg.author)
+  try:
+    logs, more = await asyncio.get_running_loop().run_in_executor(
+      None, searchLOGS, terms, author, 0, SEARCH_DM_RESULTS)
+  except SearchNotReady as e:
+    await msg.author.send(str(e))
+    return
+  if not logs:
+    await msg.author.send(f"Nothing found for {terms}")
+    return
+  lines = [
+    f"{str(el.get('createAt'))[:16]} {el['authorName']}: {el['msgContent']}"
+    for el in logs
+  ]
+  header = f"Best {len(logs)} matches for {terms}" if more else f"Matches for {terms}"
+  await sendLines(msg.author,
+                  lines,
+                  header=header,
+                  maxMessages=DM_MAX_MESSAGES,
+                  filename="search.txt")
+
+
+@router.command("!", "stats", args=["since?", "until?"], auth=True)
+async def statsCommand(msg, since=None, until=None):
+  if str(msg.author) != ADMIN:
+    await msg.author.send("Must be admin to use this command!")
+    return
+  import analytics
+  try:
+    summary = await asyncio.get_running_loop().run_in_executor(
+      None, analytics.stats, since, until)
+  except ValueError:
+    await msg.author.send(DATE_HELP)
+    return
+  perDay = summary["messagesPerDay"]
+  lines = [
+    f"Messages: {summary['messages']} from {summary['authors']} people",
+    f"Per day: {perDay['mean']:.1f} on average, {perDay['p90']:.0f} on a busy day (p90), "
+    f"trend {summary['trend']:+.1f}/day",
+    f"Busiest day: {summary['busiestDay']['day']} with {summary['busiestDay']['messages']}",
+    "Top authors:",
+  ] + [
+    f"  {el['author']}: {el['messages']} messages, {el['averageLength']} characters each"
+    for el in summary["topAuthors"]
+  ] + [f"  {el['day']}: {el['messages']}" for el in summary["perDay"]]
+  await sendLines(msg.author,
+                  lines,
+                  header=f"Activity {summary['since'][:10]} to {summary['until'][:10]}",
+                  maxMessages=DM_MAX_MESSAGES,
+                  filename="stats.txt")
+
+
+#Relay and sensor -------------------------------------------------------------------------------
+def startRelay():
+  import relay
+  #on_ready runs again after a reconnect, the sonar thread is already going
+  if runningRelay() is not None:
+    return
+  try:
+    relay.getController().start(asyncio.get_running_loop())
+  except Exception as e:
+    log.warning("Could not start the relay controller: %s", e)
+
+
+def runningRelay():
+  import relay
+  controller = relay.controller
+  return controller if controller is not None and controller.loop is not None else None
+
+
+@router.command("!", "relay", args=["action", "pin?"], auth=True)
+async def relayCommand(msg, action, pin=None):
+  import relay
+  if str(msg.author) != ADMIN:
+    await msg.author.send("Must be admin to use this command!")
+    return
+  controller = runningRelay()
+  if controller is None:
+    await msg.author.send("Relay control is off")
+    return
+  if action == "state":
+    lines = [f"Relay {pin}: {'on' if on else 'off'}" for pin, on in controller.outputs.items()]
+    lines += [f"Input {pin}: {'high' if level else 'low'}" for pin, level in controller.inputs.items()]
+    await sendLines(msg.author, lines)
+    return
+  try:
+    on = await controller.set(int(pin), RELAY_ACTIONS[action])
+  except (KeyError, TypeError, ValueError, relay.WrongPutType):
+    await msg.author.send("Usage: !relay on|off|toggle <relay pin> or !relay state")
+    return
+  await msg.author.send(f"Relay {pin} is {'on' if on else 'off'}")
+
+
+@router.command("!", "distance", auth=True)
+async def distanceCommand(msg):
+  controller = runningRelay()
+  if controller is None:
+    await msg.author.send("Relay control is off")
+    return
+  try:
+    _, _, distance, _ = await controller.next("distance")
+  except asyncio.TimeoutError:
+    await msg.author.send("The distance sensor isn't answering")
+    return
+  await msg.author.send(f"{distance:.1f} cm")
+
+
+#The ? will be used as a command to acces bs4, selenium, chatgpt, etc
+@router.command("?",
+                "songs",
+                args=["first", "last"],
+                sep="-",
+                auth=True,
+                limit="scrape")
+async def songsCommand(msg, first, last):
+  from webscrapper import getSongs
+  try:
+    first, last = int(first), int(last)
+  except ValueError:
+    await msg.author.send("Usage: ?songs-<first>-<last>")
+    return
+  #The chart is cached, but a refresh downloads the page so it runs in a thread
+  songs = await asyncio.get_running_loop().run_in_executor(
+    None, getSongs, first, last)
+  await sendLines(
+    msg.author,
+    [f"{song['num']}) {song['name']} by {song['author']}" for song in songs],
+    maxMessages=DM_MAX_MESSAGES,
+    filename="songs.txt")
+
+
+@router.command("?",
+                "roblox",
+                args=["user", "password"],
+                sep="-",
+                auth=True,
+                limit="browser")
+async def robloxCommand(msg, user, password):
+  from seleniumMine import checkRobloxNotificationAsync
+  from selenium.common.exceptions import TimeoutException
+  try:
+    notif = await checkRobloxNotificationAsync(user, password)
+  except (asyncio.TimeoutError, TimeoutException):
+    await msg.author.send("Roblox took too long, check your login")
+    return
+
+  await msg.author.send(f"You have {notif} notifications waiting in Roblox")
+
+
+@router.fallback("?", args=["prompt"], auth=True, limit="llm")
+async def chatgptCommand(msg, prompt):
+  import llmGateway
+  await llmGateway.reply(str(msg.author), prompt, msg.author)
+
+
+async def isLoggedIn(msg):
+  return await authService.checkAsync(str(msg.author))
 
 
 @client.event
@@ -53,141 +382,59 @@ async def on_message(msg):
   if msg.author == client.user:  #So that the it doesn't enter infinite loop
     return
 
-  #print(msg.content)
-  user_msg = str(msg.content)
-
-  req.body = {
+  logItem = {
     "displayName": str(msg.author.display_name),
     "authorName": str(msg.author),
     "msgContent": str(msg.content),
-    "createAt": str(msg.created_at)
+    "createAt": msg.created_at
   }
 
-  print(f"{req.body['authorName']} said {req.body['msgContent']}")
+  log.debug("%s said %s", logItem["authorName"], logItem["msgContent"])
 
-  try:
-    createLOG(req.body)
-  except Exception as e:
-    return {"message": str(e)}, 400
+  await logWriter.put(logItem)
 
-  # if "oi" in user_msg.lower():
-  #   await msg.author.send("qual foi!")
-  #   dumped = json.dumps(req.body, indent=2)
-  #   x = req.post(
-  #     url=
-  #     "http://127.0.0.1:1500/",
-  #     json=dumped)
-  #   print(x.text)
-  #   return
-
-  if user_msg[0] == '%':
-    if user_msg[1:9] == "register":
-      split = user_msg.split("-")
-      name = split[1]
-      password = split[2]
-      userJson = {"name": str(name), "password": str(password)}
-      x = req.post(url="http://127.0.0.1:1500/user/signup", json=userJson)
-      print("registering")
-      if "error" in x.json():
-        await msg.author.send(x.json()["error"])
-      else:
-        await msg.author.send("Succesfully created User")
-
-    if user_msg[1:6] == "login":
-      print("agf")
-      split = user_msg.split("-")
-      name = split[1]
-      password = split[2]
-      print("argh")
-      loginDic = {"name": name, "user": str(msg.author), "password": password}
-      print("woah")
-      x = req.post(url="http://127.0.0.1:1500/user/login", json=loginDic)
-      print("attempting login")
-      if "error" in x.json().keys():
-        print("error")
-        await msg.author.send(x.json()["error"])
-      else:
-        print("not error")
-        await msg.author.send(x.json()["result"])
-
-    elif user_msg[1:7] == "logout":
-      x = req.post(url="http://127.0.0.1:1500/user/logout",
-                   json={"user": str(msg.author)})
-      await msg.author.send(x.json()["result"])
-
-  else:
-    if check(str(msg.author)) == True:
-      #Delte scenarios and if user isn't deleteing than it is createing a log
-      if user_msg[0] == '!':
-        if "deleteM" in user_msg:
-          deleteMessage = (deleteLOGS(msg.author.display_name))
-          await msg.author.send(deleteMessage)
-        elif "deleteP" in user_msg:
-          if str(msg.author) == "em57530":
-            split = str(msg.content).split(" ")
-            deleteMessage = (deleteLOGS(split[1]))
-            await msg.author.send(deleteMessage)
-          else:
-            await msg.author.send("Must be admin to use this command!")
-
-      #Read scenarios
-      if user_msg[0] == '!' and "read" in user_msg:
-        if str(msg.author) == "em57530":
-          split = str(msg.content).split(" ")
-          toRead = split[1]
-          readItems = (readLOGS(toRead))
-          await msg.author.send(f"Items by {toRead}")
-          for el in readItems:
-            await msg.author.send(f"Item: {el['msgContent']}")
-
-      #The ? will be used as a command to acces bs4, selenium, chatgpt, etc
-      if user_msg[0] == '?':
-        if "songs" in user_msg:
-          print("getting songs")
-          split = user_msg.split("-")
-          songs = getSongs(int(split[1]), int(split[2]))
-          for song in songs:
-            await msg.author.send(
-              f"{song['num']}) {song['name']} by {song['author']}")
-
-        elif "roblox" in user_msg:
-          print("getting roblox")
-          split = user_msg.split("-")
-          print(split)
-          user = split[1]
-          password = split[2]
-          notif = checkRobloxNotification(user, password)
-
-          await msg.author.send(
-            f"You have {notif} notifications waiting in Roblox")
-
-        else:
-          print("User talking to chatgpt")
-          await msg.author.send(call(user_msg[1:]))
-        return
+  #Plain chat returns right away, only commands that need a login check the session
+  await router.dispatch(msg, msg.content, isLoggedIn)
 
 
 #Flask code----------------------------------------------------------------------------------------
 app = Flask(__name__)
 app.secret_key = Flask_key
+LOGS_MAX_LIMIT = int(config.get("LOGS_MAX_LIMIT", 10000))
+SEARCH_MAX_LIMIT = int(config.get("SEARCH_MAX_LIMIT", 100))
+UPDATE_MAX_ITEMS = int(config.get("UPDATE_MAX_ITEMS", 10000))
+
+
+@app.before_request
+def startTimer():
+  g.start = time.perf_counter()
+
+
+@app.after_request
+def recordTime(response):
+  #Streamed responses like /LOGS are timed up to the first byte
+  rule = request.url_rule.rule if request.url_rule else "unmatched"
+  httpSeconds.observe(time.perf_counter() - g.start, request.method, rule,
+                      response.status_code)
+  return response
+
+
+@app.route('/metrics', methods=["GET"])
+def metrics():
+  return Response(registry.render(), content_type=CONTENT_TYPE)
 
 
 @app.route('/', methods=["POST"])
 def index():
-  print("entered")
   if request.method == "POST":
-    print("Is method POST")
     item = request.json
-  print("rendering")
   return item
 
 
 @app.route('/user/login', methods=["POST"])
 def login():
-  print('Login')
   item = request.json
   user = User(item)
-  print(user)
   return user.signin()
 
 
@@ -203,7 +450,6 @@ def register():
   if request.method == 'POST':
     form = request.form
     user = User(form)
-    print(f"User: {user}")
     return user.signup()
   return render_template("index.html")
 
@@ -217,9 +463,54 @@ def logout():
 
 @app.route('/LOGS', methods=["GET"])
 def readMongoDBLOG():
-  print("attempting to read LOGS")
-  readitem = read()
-  return readitem
+  #GET /LOGS?after=<ObjectId>&limit=100&fields=authorName,msgContent&author=&since=&until=
+  args = request.args
+  fields = args.get("fields")
+  limit = min(args.get("limit", 100, type=int), LOGS_MAX_LIMIT)
+  try:
+    cursor = pageLOGS(after=args.get("after"),
+                      limit=max(limit, 1),
+                      fields=fields.split(",") if fields else None,
+                      author=args.get("author"),
+                      since=args.get("since"),
+                      until=args.get("until"))
+  except (InvalidId, ValueError) as e:
+    return {"message": str(e)}, 400
+  return Response(ndjson(cursor), mimetype="application/x-ndjson")
+
+
+@app.route('/LOGS/search', methods=["GET"])
+def searchMongoDBLOG():
+  #GET /LOGS/search?q=<words>&author=&offset=0&limit=20, next is the offset of the next page
+  args = request.args
+  if not args.get("q"):
+    return {"message": "q is required"}, 400
+  offset = max(args.get("offset", 0, type=int), 0)
+  limit = max(min(args.get("limit", 20, type=int), SEARCH_MAX_LIMIT), 1)
+  try:
+    logs, more = searchLOGS(args["q"], args.get("author"), offset, limit)
+  except SearchNotReady as e:
+    return {"message": str(e)}, 503
+  #Encoded once, json_util writes the ObjectIds and dates itself
+  return Response(json_util.dumps({
+    "results": logs,
+    "offset": offset,
+    "next": offset + limit if more else None
+  }), mimetype="application/json")
+
+
+@app.route('/LOGS/stats', methods=["GET"])
+def statsMongoDBLOG():
+  #GET /LOGS/stats?since=2023-10-01&until=2023-11-01&author=&top=10, the last 7 days by default
+  import analytics
+  args = request.args
+  try:
+    return analytics.stats(since=args.get("since"),
+                           until=args.get("until"),
+                           author=args.get("author"),
+                           top=min(max(args.get("top", 10, type=int), 1), 100))
+  except ValueError as e:
+    return {"message": str(e)}, 400
 
 
 @app.route('/foo')
@@ -230,11 +521,58 @@ def foo():
 @app.route('/updateLOG',
            methods=["PUT"])  #Create, read, and delete in mongodb.py
 def updateMongoDBLOG():
-  item = request.json
-  update(item)
+  #A patch {"_id": ..., "msgContent": ...} with any of displayName, authorName, msgContent and
+  #createAt, or a list of them applied in one bulk write (?docs=1 also returns the documents)
+  items = request.get_json(silent=True)
+  if isinstance(items, dict):
+    return update(items)
+  if not isinstance(items, list):
+    return {"message": "Expected a patch or a list of patches"}, 400
+  if len(items) > UPDATE_MAX_ITEMS:
+    return {"message": f"At most {UPDATE_MAX_ITEMS} patches per request"}, 413
+  return updateMany(items, returnDocs=request.args.get("docs") == "1")
+
+
+def profileStartup(top=25):
+  #Like python -X importtime, for importing main and for each module imported on first use
+  def importTimes(code):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True,
+                            text=True)
+    times = []
+    for line in result.stderr.splitlines():
+      if line.startswith("import time:") and "|" in line and "[us]" not in line:
+        selfTime, cumulative, name = line[len("import time:"):].split("|")
+        times.append((int(cumulative), int(selfTime), name.rstrip()))
+    return times
+
+  start = time.perf_counter()
+  times = importTimes("import main")
+  print(f"import main: {(time.perf_counter() - start) * 1000:.0f} ms wall")
+  print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+  for cumulative, selfTime, name in sorted(times, reverse=True)[:top]:
+    print(f"{cumulative / 1000:14.1f} {selfTime / 1000:8.1f}  {name}")
+  print("\nDeferred until first use:")
+  for module in COMMAND_MODULES:
+    own = importTimes(f"import main; import {module}")
+    deferred = [t for t in own if t[2].strip() == module]
+    if deferred:
+      print(f"{deferred[0][0] / 1000:14.1f} ms  {module}")
 
 
 if __name__ == '__main__':
 
+  if "--profile-startup" in sys.argv:
+    profileStartup()
+    sys.exit()
+  #In the background, a database that isn't reachable yet shouldn't stop the bot starting
+  Thread(target=buildIndexes, name="indexes", daemon=True).start()
+  startSearchIndex()
+  #Recounts the last days of activity buckets every ACTIVITY_REPAIR_SECONDS, 0 turns it off
+  ACTIVITY_REPAIR_SECONDS = float(config.get("ACTIVITY_REPAIR_SECONDS", 3600))
+  if ACTIVITY_REPAIR_SECONDS > 0:
+    repairActivity(ACTIVITY_REPAIR_SECONDS)
+  if config.get("SESSION_CHANGE_STREAM") == "1":
+    watchSessions()
   discord_thread = async_discord_thread()
   app.run(host="0.0.0.0", port=1500)
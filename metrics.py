@@ -0,0 +1,259 @@
+import asyncio, functools, time
+from bisect import bisect_left
+from threading import Lock
+
+
+#Metrics ------------------------------------------------------------------------------------
+#Counters and latency histograms kept in memory and served by /metrics in the Prometheus text
+#format. Each process has its own, so with several web workers every worker reports only what
+#it handled itself.
+def escape(value):
+  return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def labelText(names, values):
+  if not names:
+    return ""
+  pairs = ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+  return "{" + pairs + "}"
+
+
+class Counter:
+
+  def __init__(self, name, help, labels=()):
+    self.name = name
+    self.help = help
+    self.labels = tuple(labels)
+    self.values = {}
+    self.lock = Lock()
+
+  def inc(self, *labels, amount=1):
+    with self.lock:
+      self.values[labels] = self.values.get(labels, 0) + amount
+
+  def render(self):
+    lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+    with self.lock:
+      for labels, value in sorted(self.values.items()):
+        lines.append(f"{self.name}{labelText(self.labels, labels)} {value}")
+    return lines
+
+
+class Histogram:
+  BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+  def __init__(self, name, help, labels=(), buckets=BUCKETS):
+    self.name = name
+    self.help = help
+    self.labels = tuple(labels)
+    self.buckets = tuple(buckets)
+    #labels -> [count per bucket (the last one is +Inf), sum]
+    self.values = {}
+    self.lock = Lock()
+
+  def observe(self, value, *labels):
+    index = bisect_left(self.buckets, value)
+    with self.lock:
+      counts = self.values.get(labels)
+      if counts is None:
+        counts = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+      counts[0][index] += 1
+      counts[1] += value
+
+  def time(self, *labels):
+    return Timer(self, labels)
+
+  def render(self):
+    lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+    names = self.labels + ("le", )
+    with self.lock:
+      for labels, (counts, total) in sorted(self.values.items()):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf", ), counts):
+          cumulative += count
+          lines.append(
+            f"{self.name}_bucket{labelText(names, labels + (bound, ))} {cumulative}")
+        lines.append(f"{self.name}_sum{labelText(self.labels, labels)} {total}")
+        lines.append(
+          f"{self.name}_count{labelText(self.labels, labels)} {cumulative}")
+    return lines
+
+
+class Gauge:
+  #Read when /metrics is scraped, from a function returning a number
+  def __init__(self, name, help, function):
+    self.name = name
+    self.help = help
+    self.function = function
+
+  def render(self):
+    try:
+      value = self.function()
+    except Exception:
+      return []
+    return [
+      f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge",
+      f"{self.name} {value}"
+    ]
+
+
+class Timer:
+  #with histogram.time("label"): ... observes how long the block took
+  def __init__(self, histogram, labels):
+    self.histogram = histogram
+    self.labels = labels
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+    return False
+
+
+class Registry:
+
+  def __init__(self):
+    self.metrics = {}
+
+  def add(self, metric):
+    #Registering the same name twice returns the first one, so reloads don't double up
+    return self.metrics.setdefault(metric.name, metric)
+
+  def counter(self, name, help, labels=()):
+    return self.add(Counter(name, help, labels))
+
+  def histogram(self, name, help, labels=(), buckets=Histogram.BUCKETS):
+    return self.add(Histogram(name, help, labels, buckets))
+
+  def gauge(self, name, help, function):
+    return self.add(Gauge(name, help, function))
+
+  def render(self):
+    lines = []
+    for metric in self.metrics.values():
+      lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+commandSeconds = registry.histogram("bot_command_seconds",
+                                    "Time to handle a bot command",
+                                    ["command"])
+commandsTotal = registry.counter("bot_commands_total", "Bot commands handled",
+                                 ["command", "outcome"])
+mongoSeconds = registry.histogram("mongo_operation_seconds",
+                                  "Time spent in a mongodb.py operation",
+                                  ["operation"])
+mongoErrors = registry.counter("mongo_operation_errors_total",
+                               "mongodb.py operations that raised",
+                               ["operation"])
+externalSeconds = registry.histogram(
+  "external_call_seconds", "Time spent calling OpenAI, Billboard or Roblox",
+  ["service"])
+externalErrors = registry.counter("external_call_errors_total",
+                                  "External calls that raised", ["service"])
+httpSeconds = registry.histogram("http_request_seconds",
+                                 "Time to answer a Flask request",
+                                 ["method", "route", "status"])
+loopLag = registry.histogram(
+  "event_loop_lag_seconds",
+  "How late the discord event loop woke up from a sleep",
+  buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+
+def timed(histogram, errors, label):
+  #Decorator for sync and async functions, the error counter goes up when the call raises
+  def decorate(function):
+    if asyncio.iscoroutinefunction(function):
+
+      @functools.wraps(function)
+      async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+          return await function(*args, **kwargs)
+        except Exception:
+          errors.inc(label)
+          raise
+        finally:
+          histogram.observe(time.perf_counter() - start, label)
+    else:
+
+      @functools.wraps(function)
+      def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+          return function(*args, **kwargs)
+        except Exception:
+          errors.inc(label)
+          raise
+        finally:
+          histogram.observe(time.perf_counter() - start, label)
+
+    return wrapper
+
+  return decorate
+
+
+def timedIteration(iterable, histogram, errors, label):
+  #For lazy results, a pymongo cursor only runs its query as it is read. Adds up the time spent
+  #in next() and observes it once, when the iteration ends or is closed.
+  iterator = iter(iterable)
+  spent = 0.0
+  try:
+    while True:
+      start = time.perf_counter()
+      try:
+        item = next(iterator)
+      except StopIteration:
+        return
+      except Exception:
+        errors.inc(label)
+        raise
+      finally:
+        spent += time.perf_counter() - start
+      yield item
+  finally:
+    histogram.observe(spent, label)
+
+
+def mongoOperation(function):
+  return timed(mongoSeconds, mongoErrors, function.__name__)(function)
+
+
+def mongoCursor(cursor, operation):
+  return timedIteration(cursor, mongoSeconds, mongoErrors, operation)
+
+
+def externalCall(service):
+  return timed(externalSeconds, externalErrors, service)
+
+
+#Event loop lag -----------------------------------------------------------------------------
+#Sleeps interval seconds over and over, anything past that is time some callback held the loop
+class LoopLagMonitor:
+
+  def __init__(self, interval=0.5):
+    self.interval = interval
+    self.task = None
+    self.last = 0.0
+
+  def start(self):
+    if self.task is None or self.task.done():
+      self.task = asyncio.get_running_loop().create_task(self.monitor())
+
+  async def monitor(self):
+    loop = asyncio.get_running_loop()
+    while True:
+      start = loop.time()
+      await asyncio.sleep(self.interval)
+      self.last = max(0.0, loop.time() - start - self.interval)
+      loopLag.observe(self.last)
+
+  def stop(self):
+    if self.task is not None:
+      self.task.cancel()
+      self.task = None
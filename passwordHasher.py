@@ -0,0 +1,135 @@
+import logging, multiprocessing, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from passlib.context import CryptContext
+from passlib.hash import pbkdf2_sha256
+from config import config
+
+log = logging.getLogger(__name__)
+
+
+class HasherBusy(Exception):
+  pass
+
+
+#These run inside the worker processes so they have to be plain module functions
+def hashInProcess(password, rounds):
+  return pbkdf2_sha256.using(rounds=rounds).hash(password)
+
+
+def verifyInProcess(password, stored, rounds):
+  #min and max pinned to the configured rounds, so any hash made with other rounds
+  #gets flagged and verify_and_update hands back a new hash
+  context = CryptContext(schemes=["pbkdf2_sha256"],
+                         pbkdf2_sha256__default_rounds=rounds,
+                         pbkdf2_sha256__min_rounds=rounds,
+                         pbkdf2_sha256__max_rounds=rounds)
+  return context.verify_and_update(password, stored)
+
+
+#Password hashing pool ------------------------------------------------------------------------
+#pbkdf2 holds the GIL for the whole hash, running it in other processes keeps a burst of
+#logins from starving the Flask threads and the discord thread
+class PasswordHasher:
+
+  def __init__(self, workers=2, maxPending=32, timeout=10.0, rounds=29000):
+    self.workers = workers
+    self.maxPending = maxPending
+    self.timeout = timeout
+    self.rounds = rounds
+    self.pool = None
+    self.lock = Lock()
+    self.pending = 0
+    self.rejected = 0
+    self.latencies = deque(maxlen=1000)
+
+  def getPool(self):
+    #Created on first use so importing the module doesn't start anything. The workers come
+    #from a forkserver, forking this process would copy the Flask, discord, pymongo and
+    #logging threads' state into them
+    with self.lock:
+      if self.pool is None:
+        self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                        mp_context=multiprocessing.get_context("forkserver"))
+      return self.pool
+
+  def resetPool(self, pool):
+    #A worker died (OOM, a signal) and a broken pool refuses all work, the next call makes a
+    #new one
+    with self.lock:
+      if self.pool is pool:
+        self.pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+  def done(self, future):
+    with self.lock:
+      self.pending -= 1
+
+  def run(self, function, *args):
+    try:
+      return self.submit(function, *args)
+    except BrokenProcessPool:
+      log.warning("Password hashing pool broke, starting a new one")
+      return self.submit(function, *args)
+
+  def submit(self, function, *args):
+    pool = self.getPool()
+    with self.lock:
+      if self.pending >= self.maxPending:
+        self.rejected += 1
+        raise HasherBusy("Too many password checks waiting")
+      self.pending += 1
+    start = time.perf_counter()
+    try:
+      try:
+        future = pool.submit(function, *args)
+      except Exception:
+        self.done(None)
+        raise
+      future.add_done_callback(self.done)
+      result = future.result(timeout=self.timeout)
+    except FutureTimeout:
+      raise HasherBusy("Password check timed out")
+    except BrokenProcessPool:
+      self.resetPool(pool)
+      raise
+    self.latencies.append(time.perf_counter() - start)
+    return result
+
+  def hash(self, password):
+    return self.run(hashInProcess, password, self.rounds)
+
+  def verify(self, password, stored):
+    #Returns (matches, newHash), newHash is None unless the rounds changed
+    return self.run(verifyInProcess, password, stored, self.rounds)
+
+  def stats(self):
+    latencies = sorted(self.latencies)
+
+    def percentile(p):
+      if not latencies:
+        return 0.0
+      return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    return {
+      "pending": self.pending,
+      "rejected": self.rejected,
+      "rounds": self.rounds,
+      "p50": percentile(0.50),
+      "p90": percentile(0.90),
+      "p99": percentile(0.99)
+    }
+
+  def shutdown(self):
+    with self.lock:
+      if self.pool is not None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = None
+
+
+hasher = PasswordHasher(workers=int(config.get("HASH_WORKERS", 2)),
+                        maxPending=int(config.get("HASH_MAX_PENDING", 32)),
+                        timeout=float(config.get("HASH_TIMEOUT", 10)),
+                        rounds=int(config.get("PBKDF2_ROUNDS", 29000)))
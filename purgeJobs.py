@@ -0,0 +1,116 @@
+import asyncio, logging, secrets
+from mongodb import createPurgeJob, purgeChunk, setPurgeStatus, unfinishedPurgeJobs
+
+log = logging.getLogger(__name__)
+
+
+#Background purges --------------------------------------------------------------------------
+#!deleteM and !deleteP start a job and answer with its id straight away. The job deletes in
+#_id ordered chunks with a pause in between, so no single delete holds locks for long or
+#floods the oplog, and keeps one DM to the requester up to date with its progress.
+class PurgeJobs:
+
+  def __init__(self,
+               client,
+               batchSize=500,
+               pause=0.5,
+               editInterval=2.0,
+               concurrency=1):
+    #The discord client is only used to find the requester of a resumed job
+    self.client = client
+    self.batchSize = batchSize
+    self.pause = pause
+    self.editInterval = editInterval
+    self.concurrency = concurrency
+    self.semaphore = None
+    #job id -> (job, task) for the jobs running in this process
+    self.running = {}
+    #Ids cancelled with !cancelPurge, any other cancel (shutdown) leaves the job resumable
+    self.cancelled = set()
+
+  def progress(self, job, status):
+    return (f"Purge {job['_id']} of {job['displayName']}: {status}, "
+            f"deleted {job['deleted']} of about {job['total']}")
+
+  async def start(self, displayName, since, until, requester):
+    #Raises ValueError for bad dates
+    loop = asyncio.get_running_loop()
+    job = await loop.run_in_executor(None, createPurgeJob,
+                                     secrets.token_hex(4), displayName, since,
+                                     until, requester.id)
+    self.launch(job, requester)
+    return job["_id"]
+
+  def launch(self, job, destination):
+    if self.semaphore is None:
+      self.semaphore = asyncio.Semaphore(self.concurrency)
+    task = asyncio.get_running_loop().create_task(self.run(job, destination))
+    self.running[job["_id"]] = (job, task)
+    task.add_done_callback(lambda _: self.running.pop(job["_id"], None))
+
+  async def edit(self, job, message, status):
+    #Progress DMs are best effort, a requester with DMs closed still gets their purge
+    if message is None:
+      return
+    try:
+      await message.edit(content=self.progress(job, status))
+    except Exception as e:
+      log.warning("Could not update the progress of purge %s: %s", job["_id"], e)
+
+  async def run(self, job, destination):
+    loop = asyncio.get_running_loop()
+    message = None
+    try:
+      if destination is not None:
+        message = await destination.send(self.progress(job, "waiting"))
+    except Exception as e:
+      log.warning("Could not send the progress of purge %s: %s", job["_id"], e)
+    try:
+      async with self.semaphore:
+        lastEdit = loop.time()
+        while await loop.run_in_executor(None, purgeChunk, job,
+                                         self.batchSize):
+          if loop.time() - lastEdit >= self.editInterval:
+            await self.edit(job, message, "running")
+            lastEdit = loop.time()
+          await asyncio.sleep(self.pause)
+    except asyncio.CancelledError:
+      if job["_id"] in self.cancelled:
+        self.cancelled.discard(job["_id"])
+        await loop.run_in_executor(None, setPurgeStatus, job["_id"],
+                                   "cancelled")
+        await self.edit(job, message, "cancelled")
+      raise
+    except Exception as e:
+      log.error("Purge %s failed: %s", job["_id"], e)
+      await loop.run_in_executor(None, setPurgeStatus, job["_id"], "failed")
+      await self.edit(job, message, f"failed ({e})")
+      return
+    await loop.run_in_executor(None, setPurgeStatus, job["_id"], "done")
+    await self.edit(job, message, "done")
+
+  def cancel(self, jobId, requester, admin=False):
+    running = self.running.get(jobId)
+    if running is None:
+      return f"No running purge with id {jobId}"
+    job, task = running
+    if job["requester"] != requester.id and not admin:
+      return "You can only cancel your own purges"
+    self.cancelled.add(jobId)
+    task.cancel()
+    return f"Cancelling purge {jobId}"
+
+  async def resume(self):
+    #Jobs still marked running were interrupted by a restart, pick them up where they stopped
+    loop = asyncio.get_running_loop()
+    for job in await loop.run_in_executor(None, unfinishedPurgeJobs):
+      if job["_id"] in self.running:
+        continue
+      try:
+        requester = await self.client.fetch_user(job["requester"])
+      except Exception as e:
+        #The purge still runs, there's just nobody to tell
+        log.warning("Could not find the requester of purge %s: %s", job["_id"], e)
+        requester = None
+      log.info("Resuming purge %s after %d deleted", job["_id"], job["deleted"])
+      self.launch(job, requester)
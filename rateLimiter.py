@@ -0,0 +1,180 @@
+import asyncio, time
+from collections import deque
+from threading import Lock
+from config import config
+from metrics import registry
+
+rejectedTotal = registry.counter("bot_rate_limited_total",
+                                 "Commands refused by the token bucket", ["limit"])
+
+
+class RateLimited(Exception):
+
+  def __init__(self, retryAfter):
+    Exception.__init__(self, f"Slow down, try again in {retryAfter:.0f}s")
+    self.retryAfter = retryAfter
+
+
+#Token bucket backends ------------------------------------------------------------------------
+#take() refills the bucket for the time since the last call and takes one token.
+#Returns (allowed, seconds until a token is available).
+class MemoryBackend:
+  blocking = False
+
+  def __init__(self):
+    #key -> (tokens, last update)
+    self.buckets = {}
+    self.lock = Lock()
+
+  def take(self, key, rate, burst, cost=1):
+    now = time.monotonic()
+    with self.lock:
+      tokens, updated = self.buckets.get(key, (burst, now))
+      tokens = min(burst, tokens + (now - updated) * rate)
+      if tokens >= cost:
+        self.buckets[key] = (tokens - cost, now)
+        return True, 0.0
+      self.buckets[key] = (tokens, now)
+      return False, (cost - tokens) / rate
+
+
+TOKEN_BUCKET = """
+local data = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local tokens = tonumber(data[1]) or burst
+local updated = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+local retry = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+else
+  retry = (cost - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(retry)}
+"""
+
+
+class RedisBackend:
+  #Works with anything that has redis-py's eval(), like a real Redis shared by several bot
+  #processes or fakeredis locally. The bucket update runs as one Lua script so it is atomic.
+  blocking = True
+
+  def __init__(self, redis, prefix="ratelimit:"):
+    self.redis = redis
+    self.prefix = prefix
+
+  def take(self, key, rate, burst, cost=1):
+    allowed, retry = self.redis.eval(TOKEN_BUCKET, 1, self.prefix + key, rate,
+                                     burst, time.time(), cost)
+    return bool(int(allowed)), float(retry)
+
+
+def makeBackend():
+  url = config.get("RATE_LIMIT_REDIS_URL")
+  if url:
+    import redis
+    return RedisBackend(redis.Redis.from_url(url))
+  return MemoryBackend()
+
+
+#Concurrency gate -----------------------------------------------------------------------------
+#At most limit commands of a class run at once in this process, the rest wait in line and
+#are told their position.
+class Gate:
+
+  def __init__(self, limit):
+    self.limit = limit
+    self.running = 0
+    self.waiters = deque()
+
+  async def acquire(self, notify):
+    if self.running < self.limit and not self.waiters:
+      self.running += 1
+      return
+    future = asyncio.get_running_loop().create_future()
+    self.waiters.append(future)
+    try:
+      await notify(len(self.waiters))
+      await future
+    except BaseException:
+      #Cancelled, or the "number N in line" DM failed (DMs closed): either way don't keep the spot
+      if future in self.waiters:
+        self.waiters.remove(future)
+      elif future.done() and not future.cancelled():
+        #The slot was already handed to us, pass it on
+        self.release()
+      raise
+
+  def release(self):
+    #The slot goes straight to the next in line, so running only drops when nobody waits
+    while self.waiters:
+      future = self.waiters.popleft()
+      if not future.done():
+        future.set_result(None)
+        return
+    self.running -= 1
+
+
+def parseRate(value, default):
+  #"rate/burst", rate in commands per second: "0.05/2" is 2 at once then one every 20s
+  rate, burst = (value or default).split("/")
+  return float(rate), float(burst)
+
+
+class Governor:
+
+  def __init__(self, backend, limits):
+    #limits: class -> (rate, burst, concurrency)
+    self.backend = backend
+    self.buckets = {name: limit[:2] for name, limit in limits.items()}
+    self.gates = {name: Gate(limit[2]) for name, limit in limits.items()}
+    self.rejected = 0
+
+  async def take(self, author, limit):
+    rate, burst = self.buckets[limit]
+    key = f"{limit}:{author}"
+    if self.backend.blocking:
+      loop = asyncio.get_running_loop()
+      allowed, retry = await loop.run_in_executor(None, self.backend.take, key,
+                                                  rate, burst)
+    else:
+      allowed, retry = self.backend.take(key, rate, burst)
+    if not allowed:
+      self.rejected += 1
+      rejectedTotal.inc(limit)
+      raise RateLimited(retry)
+
+  async def run(self, msg, limit, handler, args):
+    try:
+      await self.take(str(msg.author), limit)
+    except RateLimited as e:
+      await msg.author.send(str(e))
+      return
+    gate = self.gates[limit]
+
+    async def notify(position):
+      await msg.author.send(f"Busy right now, you are number {position} in line")
+
+    await gate.acquire(notify)
+    try:
+      await handler(msg, **args)
+    finally:
+      gate.release()
+
+
+def limitsFromEnv():
+  return {
+    "browser": (*parseRate(config.get("RATE_BROWSER"), "0.0167/2"),
+                int(config.get("CONCURRENCY_BROWSER", 2))),
+    "llm": (*parseRate(config.get("RATE_LLM"), "0.2/5"),
+            int(config.get("CONCURRENCY_LLM", 8))),
+    "scrape": (*parseRate(config.get("RATE_SCRAPE"), "0.5/5"),
+               int(config.get("CONCURRENCY_SCRAPE", 4))),
+  }
@@ -1,9 +1,13 @@
+import asyncio
+import statistics
+import threading
 import time
+from collections import deque
 
-import RPi.GPIO as GPIO
+from config import config
 
 # Default put
-OUTPUT = {14:False, 15:False, 18: False}
+OUTPUT = {14: False, 15: False}
 INPUT = [2]
 
 # Special pins
@@ -12,35 +16,384 @@ IN2 = 15
 U_TRIG = 18
 U_ECHO = 2
 
+# "rpi" drives the pins through RPi.GPIO, "fake" through FakeGPIO (no Pi needed)
+GPIO_BACKEND = config.get("GPIO_BACKEND", "rpi")
+# Relay changes asked for within this many seconds go out in one write
+RELAY_BATCH_SECONDS = float(config.get("RELAY_BATCH_SECONDS", 0.02))
+# The distance is the median of this many pings, one every SONAR_INTERVAL seconds
+SONAR_SAMPLES = int(config.get("SONAR_SAMPLES", 5))
+SONAR_INTERVAL = float(config.get("SONAR_INTERVAL", 0.06))
+INPUT_BOUNCE_MS = int(config.get("INPUT_BOUNCE_MS", 50))
+
+# cm/s at about 20C, the echo covers the distance twice
+SOUND_SPEED = 34300
+# The HC-SR04 gives up after about 38ms when nothing is in range (~4m)
+ECHO_TIMEOUT = 0.04
+
+
 class WrongPutType(Exception):
     pass
 
+
+# Backends ------------------------------------------------------------------------------------
+class FakeGPIO:
+    """
+    Stands in for the parts of RPi.GPIO this module uses, so the controller runs (and can be
+    benchmarked) on a machine without a Pi. drive() plays the wiring on an input pin and fires
+    its edge callbacks, and a sonar attached with attachSonar() answers each trigger pulse with
+    an echo pulse as long as the distance it is given.
+    """
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.mode = None
+        self.directions = {}
+        self.levels = {}
+        self.detections = {}
+        self.sonars = {}
+        # output() calls, each one is a write to the pins
+        self.writes = 0
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None):
+        for pin in channel if isinstance(channel, (list, tuple)) else [channel]:
+            self.directions[pin] = direction
+            if direction == self.OUT:
+                self.levels[pin] = self.LOW if initial is None else initial
+            else:
+                self.levels[pin] = self.HIGH if pull_up_down == self.PUD_UP else self.LOW
+
+    def output(self, channel, value):
+        pins = channel if isinstance(channel, (list, tuple)) else [channel]
+        values = value if isinstance(value, (list, tuple)) else [value] * len(pins)
+        self.writes += 1
+        for pin, level in zip(pins, values):
+            if self.directions.get(pin) != self.OUT:
+                raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+            previous = self.levels[pin]
+            self.levels[pin] = self.HIGH if level else self.LOW
+            if pin in self.sonars and previous and not level:
+                self.echo(pin)
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        if pin in self.detections:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        self.detections[pin] = (edge, [callback] if callback else [])
+
+    def add_event_callback(self, pin, callback):
+        self.detections[pin][1].append(callback)
+
+    def remove_event_detect(self, pin):
+        self.detections.pop(pin, None)
+
+    def cleanup(self, channel=None):
+        self.__init__()
+
+    def drive(self, pin, level):
+        previous = self.levels.get(pin)
+        self.levels[pin] = self.HIGH if level else self.LOW
+        edge, callbacks = self.detections.get(pin, (None, []))
+        if previous == self.levels[pin] or edge is None:
+            return
+        if edge == self.BOTH or (edge == self.RISING) == bool(level):
+            for callback in callbacks:
+                callback(pin)
+
+    def attachSonar(self, trig, echo, distance):
+        """
+        :param distance: called on each ping, returns the distance in cm or None for no echo
+        """
+        self.sonars[trig] = (echo, distance)
+
+    def echo(self, trig):
+        echo, distance = self.sonars[trig]
+        cm = distance()
+        if cm is None:
+            return
+
+        def pulse():
+            self.drive(echo, self.HIGH)
+            time.sleep(cm * 2 / SOUND_SPEED)
+            self.drive(echo, self.LOW)
+
+        threading.Thread(target=pulse, daemon=True).start()
+
+
+def loadBackend(name: str):
+    if name == "fake":
+        return FakeGPIO()
+    if name == "rpi":
+        import RPi.GPIO as GPIO
+        return GPIO
+    raise ValueError(f"Unknown GPIO backend {name}")
+
+
+# Ultrasonic sensor ---------------------------------------------------------------------------
+class Sonar:
+    """
+    HC-SR04 on trig/echo. An edge-detection callback timestamps both edges of the echo pulse, so
+    nothing spins on the pin while it waits. run() pings every interval seconds on its own
+    thread and publishes the median of the last samples pings, which drops the odd reflection.
+    """
+
+    def __init__(self, gpio, trig: int, echo: int, samples=5, interval=0.06):
+        self.gpio = gpio
+        self.trig = trig
+        self.echo = echo
+        self.window = deque(maxlen=samples)
+        self.interval = interval
+        self.rise = None
+        self.width = None
+        self.received = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def setup(self):
+        self.gpio.setup(self.trig, self.gpio.OUT, initial=self.gpio.LOW)
+        self.gpio.setup(self.echo, self.gpio.IN, pull_up_down=self.gpio.PUD_DOWN)
+        self.gpio.add_event_detect(self.echo, self.gpio.BOTH, callback=self.edge)
+
+    def edge(self, pin):
+        now = time.perf_counter()
+        if self.gpio.input(pin):
+            self.rise = now
+        elif self.rise is not None:
+            self.width = now - self.rise
+            self.rise = None
+            self.received.set()
+
+    def ping(self):
+        """
+        :return: one distance in cm, None when no echo came back in time
+        """
+        self.received.clear()
+        self.rise = None
+        self.gpio.output(self.trig, self.gpio.HIGH)
+        time.sleep(0.00001)
+        self.gpio.output(self.trig, self.gpio.LOW)
+        if not self.received.wait(ECHO_TIMEOUT):
+            return None
+        return self.width * SOUND_SPEED / 2
+
+    def run(self, publish):
+        while not self.stopped.is_set():
+            reading = self.ping()
+            if reading is not None:
+                self.window.append(reading)
+                publish(statistics.median(self.window))
+            # Also lets the last ping's echoes die out before the next one
+            self.stopped.wait(self.interval)
+
+    def start(self, publish):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, args=(publish,), name="sonar", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+# Controller ----------------------------------------------------------------------------------
+class RelayController:
+    """
+    Owns the pins. Relays are active low (LOW is on) and their state lives in outputs, inputs
+    are kept up to date by edge callbacks instead of being read. Once started on a loop,
+    everything it sees goes onto events, an asyncio queue of (kind, pin, value, time) where
+    kind is "input", "distance" or "relay", dropping the oldest when nobody reads it.
+    """
+
+    def __init__(self, gpio, window=RELAY_BATCH_SECONDS, samples=SONAR_SAMPLES,
+                 interval=SONAR_INTERVAL, queueSize=1000):
+        self.gpio = gpio
+        self.window = window
+        self.outputs = dict(OUTPUT)
+        self.inputs = {}
+        self.sonar = Sonar(gpio, U_TRIG, U_ECHO, samples, interval)
+        self.lock = threading.Lock()
+        self.loop = None
+        self.events = None
+        self.queueSize = queueSize
+        self.latest = {}
+        self.waiters = {}
+        self.pending = []
+        self.flushed = None
+
+    def setup(self):
+        self.gpio.setmode(self.gpio.BCM)
+        for pin in self.outputs:
+            self.gpio.setup(pin, self.gpio.OUT, initial=self.level(self.outputs[pin]))
+        for pin in INPUT:
+            if pin != U_ECHO:
+                self.watch(pin)
+        self.sonar.setup()
+
+    def level(self, on: bool):
+        return self.gpio.LOW if on else self.gpio.HIGH
+
+    def watch(self, pin: int):
+        self.gpio.setup(pin, self.gpio.IN, pull_up_down=self.gpio.PUD_DOWN)
+        self.inputs[pin] = self.gpio.input(pin)
+        self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=self.edge,
+                                   bouncetime=INPUT_BOUNCE_MS)
+
+    def edge(self, pin):
+        self.inputs[pin] = self.gpio.input(pin)
+        self.publish("input", pin, self.inputs[pin])
+
+    # Events
+    def start(self, loop, sonar=True):
+        self.loop = loop
+        self.events = asyncio.Queue(self.queueSize)
+        if sonar:
+            self.sonar.start(lambda distance: self.publish("distance", U_ECHO, distance))
+
+    def publish(self, kind, pin, value):
+        # From any thread, the queue is only touched on the loop
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.push, (kind, pin, value, time.time()))
+
+    def push(self, event):
+        self.latest[event[0], event[1]] = event
+        for waiter in self.waiters.pop(event[0], []):
+            if not waiter.done():
+                waiter.set_result(event)
+        if self.events.full():
+            self.events.get_nowait()
+        self.events.put_nowait(event)
+
+    async def next(self, kind, timeout=1.0):
+        """
+        :return: the next (kind, pin, value, time) event of that kind
+        """
+        waiter = self.loop.create_future()
+        self.waiters.setdefault(kind, []).append(waiter)
+        return await asyncio.wait_for(waiter, timeout)
+
+    # Relays
+    def write(self, changes):
+        """
+        :param changes: (pin, True/False, or None to toggle) in order
+        :return: the pins that changed, all written with a single output() call
+        """
+        with self.lock:
+            states = dict(self.outputs)
+            for pin, on in changes:
+                if pin not in states:
+                    raise WrongPutType
+                states[pin] = not states[pin] if on is None else on
+            changed = [pin for pin in states if states[pin] != self.outputs[pin]]
+            if changed:
+                self.gpio.output(changed, [self.level(states[pin]) for pin in changed])
+            self.outputs = states
+        for pin in changed:
+            self.publish("relay", pin, states[pin])
+        return changed
+
+    async def set(self, pin: int, on=None):
+        """
+        Queues a change (None toggles) and waits for the batch it went out in.
+        :return: the pin's state after that batch, its input state if it was put to "in" meanwhile
+        """
+        if pin not in self.outputs:
+            raise WrongPutType
+        self.pending.append((pin, on))
+        if self.flushed is None:
+            self.flushed = self.loop.create_future()
+            self.loop.call_later(self.window, self.flush)
+        await asyncio.shield(self.flushed)
+        return self.state(pin)
+
+    def flush(self):
+        changes, self.pending = self.pending, []
+        flushed, self.flushed = self.flushed, None
+        try:
+            # A pin put to "in" while its change waited is left out
+            flushed.set_result(self.write([(pin, on) for pin, on in changes if pin in self.outputs]))
+        except Exception as e:
+            flushed.set_exception(e)
+
+    def state(self, pin: int):
+        if pin in self.inputs:
+            return self.inputs[pin]
+        if pin in self.outputs:
+            return self.outputs[pin]
+        raise WrongPutType
+
+    def put(self, pin: int, putmode: str):
+        putmode = putmode.lower()
+        if putmode not in ("in", "out"):
+            raise ValueError(f"Unknown put mode {putmode}")
+        if pin in (U_TRIG, U_ECHO):
+            raise WrongPutType
+        with self.lock:
+            if pin in self.inputs:
+                self.gpio.remove_event_detect(pin)
+                del self.inputs[pin]
+            self.outputs.pop(pin, None)
+            if putmode == "out":
+                self.gpio.setup(pin, self.gpio.OUT, initial=self.level(False))
+                self.outputs[pin] = False
+            else:
+                self.watch(pin)
+
+    def cleanup(self, force=False):
+        self.sonar.stop()
+        self.gpio.cleanup()
+        self.gpio.setmode(self.gpio.BCM)
+        if force:
+            for i in range(2, 28):
+                self.gpio.setup(i, self.gpio.IN)
+
+
+# Module functions ----------------------------------------------------------------------------
+controller = None
+
+
+def getController():
+    global controller
+    if controller is None:
+        controller = RelayController(loadBackend(GPIO_BACKEND))
+        controller.setup()
+    return controller
+
+
 def on(pin: int):
-    if pin in INPUT: raise WrongPutType
-    OUTPUT[pin] = True
-    GPIO.output(pin, GPIO.LOW)
+    getController().write([(pin, True)])
+
 
 def off(pin: int):
-    if pin in INPUT: raise WrongPutType
-    OUTPUT[pin] = False
-    GPIO.output(pin, GPIO.HIGH)
+    getController().write([(pin, False)])
+
 
 def toggle(pin: int):
-    if pin in INPUT: raise WrongPutType
-    if OUTPUT[pin]:
-        OUTPUT[pin] = False
-        GPIO.output(pin, GPIO.LOW)
-    else:
-        OUTPUT[pin] = True
-        GPIO.output(pin, GPIO.HIGH)
+    getController().write([(pin, None)])
 
 
 def state(pin: int):
-    if pin in INPUT:
-        return GPIO.input(pin)
-    elif pin in OUTPUT.keys():
-        return OUTPUT[pin]
-    GPIO.output(pin, GPIO.LOW)
+    return getController().state(pin)
+
 
 def put(pin: int, putmode: str):
     """
@@ -48,22 +401,8 @@ def put(pin: int, putmode: str):
     :param putmode: "in" or "out" determines which put mode it will be in (output/input).
     :return: None
     """
-    if pin in OUTPUT.keys() or pin in INPUT:
-        del OUTPUT[pin]
-        INPUT.remove(pin)
-    if putmode.lower() == "out":
-        OUTPUT[pin] = False
+    getController().put(pin, putmode)
+
 
 def cleanup(force=False):
-    GPIO.cleanup()
-    GPIO.setmode(GPIO.BCM)
-    if force:
-        for i in range(2,28):
-            GPIO.setup(i, GPIO.IN)
-
-GPIO.setmode(GPIO.BCM)
-for i in OUTPUT:
-    GPIO.setup(i, GPIO.OUT)
-    off(i)
-for i in INPUT:
-    GPIO.setup(i, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
\ No newline at end of file
+    getController().cleanup(force)
@@ -0,0 +1,129 @@
+import hashlib, re, time, zlib
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+from config import config
+
+
+#Response cache -------------------------------------------------------------------------------
+#Opt in (CHAT_CACHE=1). Prompts are normalized and hashed for exact hits, and when
+#CHAT_CACHE_SIMILARITY is set a prompt whose embedding is at least that close to a cached one
+#reuses its reply too. Embeddings are hashed character trigrams, computed locally, and searched
+#by brute force with one matrix product. The key is the prompt alone, so callers only use the
+#cache for the first prompt of a conversation.
+#Trigrams measure how alike prompts are spelled, not what they mean: "install python" and
+#"uninstall python" score 0.885, "capital of france" and "capital of spain" 0.794, while a
+#real paraphrase ("how do I" / "how to") is no higher. Above MIN_SIMILARITY it only catches
+#the same words reordered, so lower thresholds are refused rather than answering a different
+#question. Telling paraphrases apart would take a real embedding model.
+MIN_SIMILARITY = 0.95
+
+
+class ResponseCache:
+
+  def __init__(self,
+               enabled=False,
+               maxEntries=2000,
+               ttl=86400,
+               maxEntryChars=4000,
+               similarity=None,
+               dims=256):
+    if similarity is not None and similarity < MIN_SIMILARITY:
+      raise ValueError(f"CHAT_CACHE_SIMILARITY must be at least {MIN_SIMILARITY}, "
+                       "lower thresholds reuse replies to different questions")
+    self.enabled = enabled
+    self.maxEntries = maxEntries
+    self.ttl = ttl
+    self.maxEntryChars = maxEntryChars
+    self.similarity = similarity
+    self.dims = dims
+    #key -> (reply, expires, row)
+    self.entries = OrderedDict()
+    self.vectors = np.zeros((maxEntries, dims), dtype=np.float32)
+    self.valid = np.zeros(maxEntries, dtype=bool)
+    self.rowKeys = [None] * maxEntries
+    self.freeRows = list(range(maxEntries - 1, -1, -1))
+    self.lock = Lock()
+    self.exactHits = 0
+    self.similarHits = 0
+    self.misses = 0
+
+  def normalize(self, prompt):
+    return " ".join(re.sub(r"[^\w\s]", " ", prompt.lower()).split())
+
+  def embed(self, text):
+    vector = np.zeros(self.dims, dtype=np.float32)
+    text = f" {text} "
+    for i in range(len(text) - 2):
+      vector[zlib.crc32(text[i:i + 3].encode()) % self.dims] += 1
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+  def remove(self, key):
+    reply, expires, row = self.entries.pop(key)
+    self.valid[row] = False
+    self.rowKeys[row] = None
+    self.freeRows.append(row)
+
+  def get(self, prompt):
+    if not self.enabled:
+      return None
+    text = self.normalize(prompt)
+    key = hashlib.sha1(text.encode()).hexdigest()
+    now = time.monotonic()
+    with self.lock:
+      entry = self.entries.get(key)
+      similar = False
+      if entry is None and self.similarity and self.valid.any():
+        scores = self.vectors @ self.embed(text)
+        scores[~self.valid] = -1
+        row = int(scores.argmax())
+        if scores[row] >= self.similarity:
+          key = self.rowKeys[row]
+          entry = self.entries[key]
+          similar = True
+      if entry is None or entry[1] < now:
+        if entry is not None:
+          self.remove(key)
+        self.misses += 1
+        return None
+      if similar:
+        self.similarHits += 1
+      else:
+        self.exactHits += 1
+      self.entries.move_to_end(key)
+      return entry[0]
+
+  def put(self, prompt, reply):
+    if not self.enabled or len(reply) > self.maxEntryChars:
+      return
+    text = self.normalize(prompt)
+    key = hashlib.sha1(text.encode()).hexdigest()
+    with self.lock:
+      if key in self.entries:
+        self.remove(key)
+      if not self.freeRows:
+        self.remove(next(iter(self.entries)))
+      row = self.freeRows.pop()
+      self.vectors[row] = self.embed(text)
+      self.valid[row] = True
+      self.rowKeys[row] = key
+      self.entries[key] = (reply, time.monotonic() + self.ttl, row)
+
+  def stats(self):
+    total = self.exactHits + self.similarHits + self.misses
+    return {
+      "size": len(self.entries),
+      "exactHits": self.exactHits,
+      "similarHits": self.similarHits,
+      "misses": self.misses,
+      "hitRate": (self.exactHits + self.similarHits) / total if total else 0.0
+    }
+
+
+cache = ResponseCache(enabled=config.get("CHAT_CACHE") == "1",
+                      maxEntries=int(config.get("CHAT_CACHE_SIZE", 2000)),
+                      ttl=float(config.get("CHAT_CACHE_TTL", 86400)),
+                      maxEntryChars=int(config.get("CHAT_CACHE_MAX_CHARS", 4000)),
+                      similarity=float(config.get("CHAT_CACHE_SIMILARITY"))
+                      if config.get("CHAT_CACHE_SIMILARITY") else None)
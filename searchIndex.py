@@ -0,0 +1,128 @@
+import math
+from array import array
+from threading import Lock
+import numpy as np
+from bson import ObjectId
+from searchTerms import tokenize
+
+
+#Inverted index -------------------------------------------------------------------------------
+#term -> posting list of document numbers (and how often the term appears in each), kept in
+#typed arrays so a million messages fit in tens of MB. Document numbers go up in the order
+#messages are added, which is _id order, so every posting list is sorted and the arrays can be
+#read by NumPy without a copy to intersect and rank them (BM25).
+class SearchIndex:
+  K1 = 1.2
+  B = 0.75
+
+  def __init__(self):
+    #document number -> its 12 byte ObjectId, one after the other
+    self.ids = bytearray()
+    self.lengths = array("H")
+    self.postings = {}
+    self.authors = {}
+    self.totalLength = 0
+    self.lastId = None
+    self.lock = Lock()
+
+  def __len__(self):
+    return len(self.lengths)
+
+  def add(self, doc):
+    terms = {}
+    for token in tokenize(doc.get("msgContent") or ""):
+      terms[token] = terms.get(token, 0) + 1
+    length = min(sum(terms.values()), 65535)
+    with self.lock:
+      if self.lastId is not None and doc["_id"] <= self.lastId:
+        #Already in (the write path and catching up can both see a message), or older than
+        #the newest message in the index, which only a rebuild picks up
+        return
+      number = len(self.lengths)
+      #New posting lists are made first, then ids, lengths and the postings grow together
+      new = {}
+      postings = []
+      for term, count in terms.items():
+        posting = self.postings.get(term)
+        if posting is None:
+          posting = new[term] = (array("I"), array("H"))
+        postings.append((posting, min(count, 65535)))
+      self.lengths.append(length)
+      self.ids += doc["_id"].binary
+      self.totalLength += length
+      self.postings.update(new)
+      for (docs, freqs), count in postings:
+        docs.append(number)
+        freqs.append(count)
+      author = doc.get("authorName")
+      if author is not None:
+        self.authors.setdefault(author, array("I")).append(number)
+      self.lastId = doc["_id"]
+
+  def addMany(self, docs):
+    for doc in docs:
+      self.add(doc)
+
+  def objectId(self, number):
+    return ObjectId(bytes(self.ids[number * 12:number * 12 + 12]))
+
+  def search(self, text, author=None, offset=0, limit=20):
+    #Messages with every term, best first (newest first on ties). Returns (matches, [(_id,
+    #score)]) for the page starting at offset.
+    terms = list(dict.fromkeys(tokenize(text)))
+    if not terms:
+      return 0, []
+    #NumPy reads the arrays in place and an array can't grow while that happens (add() would
+    #raise BufferError), so every view lives in rank() and is gone before the lock is released
+    with self.lock:
+      return self.rank(terms, author, offset, limit)
+
+  def rank(self, terms, author, offset, limit):
+    #Called with the lock held
+    count = len(self.lengths)
+    postings = [self.postings.get(term) for term in terms]
+    if any(posting is None for posting in postings):
+      return 0, []
+    lists = [(np.frombuffer(docs, dtype=np.uint32), np.frombuffer(freqs, dtype=np.uint16))
+             for docs, freqs in postings]
+    lengths = np.frombuffer(self.lengths, dtype=np.uint16)
+    averageLength = self.totalLength / count
+    authorDocs = None
+    if author is not None:
+      authorDocs = self.authors.get(author)
+      if authorDocs is None:
+        return 0, []
+      authorDocs = np.frombuffer(authorDocs, dtype=np.uint32)
+
+    #Shortest list first, the intersection can only shrink
+    filters = [docs for docs, _ in lists]
+    if authorDocs is not None:
+      filters.append(authorDocs)
+    filters.sort(key=len)
+    matches = filters[0]
+    for docs in filters[1:]:
+      if not len(matches):
+        break
+      #Binary search each remaining match in the longer (sorted) list
+      found = np.minimum(np.searchsorted(docs, matches), len(docs) - 1)
+      matches = matches[docs[found] == matches]
+    if not len(matches):
+      return 0, []
+
+    scores = np.zeros(len(matches), dtype=np.float64)
+    norm = self.K1 * (1 - self.B + self.B * lengths[matches] / averageLength)
+    for docs, freqs in lists:
+      idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+      #matches is a subset of docs, the same length means every doc matched
+      tf = (freqs if len(docs) == len(matches) else
+            freqs[np.searchsorted(docs, matches)]).astype(np.float64)
+      scores += idf * tf * (self.K1 + 1) / (tf + norm)
+    #Only the best offset + limit need sorting: by score, then newer messages first
+    top = offset + limit
+    if top < len(matches):
+      best = np.argpartition(-scores, top - 1)[:top]
+    else:
+      best = np.arange(len(matches))
+    order = best[np.lexsort((-matches[best].astype(np.int64), -scores[best]))][offset:]
+    page = [(self.objectId(int(matches[i])), float(scores[i])) for i in order]
+    return len(matches), page
@@ -0,0 +1,15 @@
+import re
+
+#Shared by both search backends, kept apart from searchIndex so the text backend never loads
+#NumPy
+TOKEN = re.compile(r"\w{2,}")
+#Longer messages still count, their extra words just aren't indexed
+MAX_TOKENS = 200
+
+
+class SearchNotReady(Exception):
+  pass
+
+
+def tokenize(text):
+  return TOKEN.findall(text.lower())[:MAX_TOKENS]
@@ -1,68 +1,165 @@
-import time
+import asyncio, atexit, hashlib, logging, queue
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from config import config
+from metrics import externalCall
 
+log = logging.getLogger(__name__)
 
-def checkRobloxNotification(user, passer):
-  print("In function")
-  options = webdriver.ChromeOptions()
-
-  print("Chromedriver")
-
-  try:
-    options.add_experimental_option("detach", True)
-    options.add_argument("--start-maximized")
-
-    browser = webdriver.Chrome(options = options, service = Service("Tarefa 8 Ultimate Discord Bot/drivers/chromedriver.exe"))
-
-  except Exception as e:
-    print(e)
+#ROBLOX_URL can point at a local copy of the login/home pages for testing
+ROBLOX_URL = config.get("ROBLOX_URL", "https://www.roblox.com").rstrip("/")
+CHROMEDRIVER_PATH = config.get("CHROMEDRIVER_PATH")
+BROWSER_WORKERS = int(config.get("BROWSER_WORKERS", 2))
+BROWSER_MAX_USES = int(config.get("BROWSER_MAX_USES", 50))
+#How long a page gets to show what we are waiting for
+BROWSER_WAIT = float(config.get("BROWSER_WAIT", 15))
+#How long a ?roblox command can wait for a free browser plus the check itself
+BROWSER_TIMEOUT = float(config.get("BROWSER_TIMEOUT", 60))
 
-  print("In service")
+NOTIFICATION = (By.XPATH, '//*[@id="nav-friends"]/div[2]/span')
 
-  time.sleep(1)
 
-  browser.get("https://www.roblox.com/Login")
-  time.sleep(3)
-
-  print("In browser")
-
-  username = browser.find_element(by=By.NAME, value="username")
-  time.sleep(1)
+def newBrowser():
+  options = webdriver.ChromeOptions()
+  options.add_argument("--headless=new")
+  options.add_argument("--no-sandbox")
+  options.add_argument("--disable-dev-shm-usage")
+  service = Service(CHROMEDRIVER_PATH) if CHROMEDRIVER_PATH else Service()
+  return webdriver.Chrome(options=options, service=service)
+
+
+#Browser pool ---------------------------------------------------------------------------------
+#Up to BROWSER_WORKERS headless Chromes stay open between commands. A browser is quit and
+#replaced after BROWSER_MAX_USES checks, or as soon as it errors.
+class Worker:
+
+  def __init__(self):
+    self.browser = newBrowser()
+    self.uses = 0
+
+
+class BrowserPool:
+
+  def __init__(self, size, maxUses):
+    self.size = size
+    self.maxUses = maxUses
+    self.idle = queue.LifoQueue()
+    self.created = 0
+    self.lock = Lock()
+    #account -> cookies from its last login, so the next check can skip logging in
+    self.sessions = {}
+
+  def acquire(self, timeout):
+    try:
+      return self.idle.get_nowait()
+    except queue.Empty:
+      pass
+    with self.lock:
+      create = self.created < self.size
+      if create:
+        self.created += 1
+    if create:
+      try:
+        return Worker()
+      except Exception:
+        with self.lock:
+          self.created -= 1
+        raise
+    return self.idle.get(timeout=timeout)
+
+  def discard(self, worker):
+    with self.lock:
+      self.created -= 1
+    try:
+      worker.browser.quit()
+    except Exception:
+      #Already gone, quit() can't reach chromedriver
+      pass
+
+  def release(self, worker):
+    worker.uses += 1
+    if worker.uses >= self.maxUses:
+      self.discard(worker)
+    else:
+      self.idle.put(worker)
+
+  def run(self, function, *args, timeout=BROWSER_TIMEOUT):
+    worker = self.acquire(timeout)
+    try:
+      result = function(self, worker.browser, *args)
+    except TimeoutException:
+      #Wrong password or a slow page, the browser itself is fine
+      self.release(worker)
+      raise
+    except Exception:
+      #Crashed or stuck browsers don't go back in the pool. A dead chromedriver raises urllib3's
+      #MaxRetryError or ConnectionRefusedError rather than a WebDriverException
+      self.discard(worker)
+      raise
+    self.release(worker)
+    return result
+
+  def close(self):
+    while True:
+      try:
+        self.discard(self.idle.get_nowait())
+      except queue.Empty:
+        return
+
+
+pool = BrowserPool(BROWSER_WORKERS, BROWSER_MAX_USES)
+atexit.register(pool.close)
+#One thread per browser, extra ?roblox commands wait in this executor's queue
+executor = ThreadPoolExecutor(max_workers=BROWSER_WORKERS,
+                              thread_name_prefix="browser")
+
+
+def readNotifications(pool, browser, user, passer):
+  wait = WebDriverWait(browser, BROWSER_WAIT)
+  #The password is part of the key so knowing a username isn't enough to reuse its session
+  account = f"{user}:{hashlib.sha256(passer.encode()).hexdigest()}"
+  cookies = pool.sessions.get(account)
+  browser.delete_all_cookies()
+  if cookies:
+    #Cookies can only be set for the site that is open
+    browser.get(f"{ROBLOX_URL}/home")
+    for cookie in cookies:
+      browser.add_cookie(cookie)
+    browser.get(f"{ROBLOX_URL}/home")
+    try:
+      return wait.until(EC.visibility_of_element_located(NOTIFICATION)).text
+    except TimeoutException:
+      #Session expired, log in again
+      pool.sessions.pop(account, None)
+      browser.delete_all_cookies()
+
+  log.debug("Logging in to roblox")
+  browser.get(f"{ROBLOX_URL}/Login")
+  username = wait.until(EC.presence_of_element_located((By.NAME, "username")))
   password = browser.find_element(by=By.NAME, value="password")
-  time.sleep(1)
-  print("Got keys")
-
-  print(user)
-  print(password)
-
   username.send_keys(user)
-  time.sleep(1)
   password.send_keys(passer)
+  browser.find_element(by=By.ID, value="login-button").click()
 
-  print("Sent keys")
-  time.sleep(1)
-
-  loginButton = browser.find_element(by=By.ID, value="login-button")
-  loginButton.click()
-  time.sleep(6)
-
-  print("logged in")
-
-
-
-  time.sleep(1)
-
-  notif = browser.find_element(By.XPATH, value = '//*[@id="nav-friends"]/div[2]/span').text
-  #notif = browser.find_element(By.CLASS_NAME, value = "notification-blue notification").text
-
-  print(notif)
-
+  notif = wait.until(EC.visibility_of_element_located(NOTIFICATION)).text
+  log.debug("Logged in to roblox")
+  pool.sessions[account] = browser.get_cookies()
+  return notif
 
 
+@externalCall("roblox")
+def checkRobloxNotification(user, passer):
+  return pool.run(readNotifications, user, passer)
 
 
-  return notif
+async def checkRobloxNotificationAsync(user, passer):
+  loop = asyncio.get_running_loop()
+  return await asyncio.wait_for(
+    loop.run_in_executor(executor, checkRobloxNotification, user, passer),
+    BROWSER_TIMEOUT)
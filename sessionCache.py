@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+#LRU cache with TTL ----------------------------------------------------------------------------
+#Holds author -> logged in (True/False) so check() doesn't go to mongodb on every message.
+#False is cached too, most people talking in a server never log in.
+class SessionCache:
+
+  def __init__(self, maxSize=100000, ttl=300, negativeTtl=60):
+    self.maxSize = maxSize
+    self.ttl = ttl
+    self.negativeTtl = negativeTtl
+    self.items = OrderedDict()
+    self.enabled = True
+    #Flask threads and the discord thread both use the cache
+    self.lock = Lock()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def get(self, author):
+    #Returns None when the author isn't cached (or expired)
+    with self.lock:
+      item = self.items.get(author)
+      if item is None:
+        self.misses += 1
+        return None
+      value, expires = item
+      if expires < time.monotonic():
+        del self.items[author]
+        self.misses += 1
+        return None
+      self.items.move_to_end(author)
+      self.hits += 1
+      return value
+
+  def set(self, author, loggedIn):
+    ttl = self.ttl if loggedIn else self.negativeTtl
+    with self.lock:
+      if not self.enabled:
+        return
+      self.items[author] = (loggedIn, time.monotonic() + ttl)
+      self.items.move_to_end(author)
+      while len(self.items) > self.maxSize:
+        self.items.popitem(last=False)
+        self.evictions += 1
+
+  def invalidate(self, author):
+    with self.lock:
+      self.items.pop(author, None)
+
+  def clear(self):
+    with self.lock:
+      self.items.clear()
+
+  def disable(self):
+    #For when other processes log users in and out and nothing tells this one, every get
+    #misses from now on
+    with self.lock:
+      self.enabled = False
+      self.items.clear()
+
+  def stats(self):
+    total = self.hits + self.misses
+    return {
+      "size": len(self.items),
+      "maxSize": self.maxSize,
+      "hits": self.hits,
+      "misses": self.misses,
+      "evictions": self.evictions,
+      "hitRate": self.hits / total if total else 0.0
+    }
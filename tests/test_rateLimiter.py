@@ -0,0 +1,57 @@
+#python -m unittest discover tests
+import asyncio, os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from rateLimiter import Governor, MemoryBackend
+
+
+class Author:
+
+  def __init__(self, name, dmsClosed=False):
+    self.name = name
+    self.dmsClosed = dmsClosed
+
+  def __str__(self):
+    return self.name
+
+  async def send(self, content):
+    if self.dmsClosed:
+      raise RuntimeError("Cannot send messages to this user")
+
+
+class Message:
+
+  def __init__(self, author):
+    self.author = author
+
+
+class GateTest(unittest.IsolatedAsyncioTestCase):
+
+  async def testFailedNotifyGivesUpTheSpot(self):
+    #One slot, held while a user with DMs closed queues up: their notify fails
+    governor = Governor(MemoryBackend(), {"browser": (100, 100, 1)})
+    gate = governor.gates["browser"]
+    held = asyncio.Event()
+    done = asyncio.Event()
+
+    async def hold(msg):
+      held.set()
+      await done.wait()
+
+    async def noop(msg):
+      pass
+
+    first = asyncio.create_task(governor.run(Message(Author("a")), "browser", hold, {}))
+    await held.wait()
+    with self.assertRaises(RuntimeError):
+      await governor.run(Message(Author("b", dmsClosed=True)), "browser", noop, {})
+    self.assertEqual(len(gate.waiters), 0)
+    done.set()
+    await first
+    self.assertEqual(gate.running, 0)
+    await asyncio.wait_for(governor.run(Message(Author("c")), "browser", noop, {}), 1)
+    self.assertEqual(gate.running, 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
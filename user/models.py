@@ -1,34 +1,26 @@
+import logging
 from flask import Flask, jsonify, session
-from passlib.hash import pbkdf2_sha256
-from mongodb import createUser, loginUser, signOutUser
-import uuid
+import authService
+
+log = logging.getLogger(__name__)
 
 class User:
   def __init__(self, user):
     self.user = user
 
-  
+
   def signin(self):
-    print("entered signin")    
-    result = loginUser(self.user)
+    log.debug("Sign in %s", self.user.get("name"))
+    result = authService.login(self.user)
     return jsonify(result[0])
 
   def signout(self):
-    print("user attempting signout")
-    result = signOutUser(self.user)
+    log.debug("Sign out %s", self.user.get("user"))
+    result = authService.logout(self.user)
     return jsonify(result[0])
-      
+
   def signup(self):
-    print("entered signup")
-    print(self.user)
-    print(self.user["name"])
-    user = {
-      "_id": uuid.uuid4().hex,
-      "name": self.user["name"],
-      "password": self.user["password"]
-    }
-    user["password"] = pbkdf2_sha256.hash(user["password"])
-    result = createUser(user)
-    print(result[0])
+    log.debug("Sign up %s", self.user["name"])
+    result = authService.register(self.user)
     return jsonify(result[0])
-    
\ No newline at end of file
+
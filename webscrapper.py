@@ -1,24 +1,108 @@
+import json, logging, os, time
+from threading import Lock
 import requests as req
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from config import config
+from metrics import externalCall
 
+log = logging.getLogger(__name__)
 
-def getSongs(first, last):
-  source = req.get("https://www.billboard.com/charts/hot-100/")
-
-  soup = BeautifulSoup(source.text, "html.parser")
-  chart = soup.find(
-    "div", {
-      "class":
-      "chart-results-list // lrv-u-padding-t-150 lrv-u-padding-t-050@mobile-max"
-    })
-  list = chart.find_all("div", {"class": "o-chart-results-list-row-container"},
-                        limit=last)
+try:
+  import lxml
+  PARSER = "lxml"
+except ImportError:
+  PARSER = "html.parser"
+
+#CHART_URL can point at a saved copy of the chart page for testing
+CHART_URL = config.get("CHART_URL", "https://www.billboard.com/charts/hot-100/")
+ROW_CLASS = "o-chart-results-list-row-container"
+
+#Chart cache ------------------------------------------------------------------------------------
+#The Hot 100 changes once a week, so it is parsed once and ?songs just slices the list.
+#After CHART_TTL seconds it is revalidated with ETag/Last-Modified, CHART_CACHE_FILE keeps it
+#across restarts.
+CHART_TTL = float(config.get("CHART_TTL", 3600))
+CHART_CACHE_FILE = config.get("CHART_CACHE_FILE")
+
+session = req.Session()
+chart = {"songs": [], "etag": None, "lastModified": None, "fetchedAt": 0}
+#Only one thread refreshes, the others wait for it and use its result
+refreshLock = Lock()
+
+
+def isRow(classes):
+  #While parsing class can still be the raw attribute, rows have more than one class
+  if isinstance(classes, str):
+    classes = classes.split()
+  return classes is not None and ROW_CLASS in classes
+
+
+def parseChart(html):
+  #Only the chart rows get parsed, the rest of the page is skipped
+  rows = BeautifulSoup(html,
+                       PARSER,
+                       parse_only=SoupStrainer("div", {"class": isRow}))
   songs = []
-  for i, el in enumerate(list[first:]):
+  for i, el in enumerate(rows.find_all("div", {"class": ROW_CLASS})):
     author = el.find_all("span", {"class": "c-label"})
     name = el.find("h3", {"id": "title-of-a-story"}).get_text().strip()
     author = author[1].get_text().strip()
-    song = {"name": name, "author": author, "num": i + 1 + first}
-    songs.append(song)
-
+    songs.append({"name": name, "author": author, "num": i + 1})
   return songs
+
+
+def loadChart():
+  if CHART_CACHE_FILE and os.path.exists(CHART_CACHE_FILE):
+    with open(CHART_CACHE_FILE) as file:
+      chart.update(json.load(file))
+
+
+def saveChart():
+  if CHART_CACHE_FILE:
+    with open(CHART_CACHE_FILE, "w") as file:
+      json.dump(chart, file)
+
+
+def fresh():
+  return chart["songs"] and time.time() - chart["fetchedAt"] < CHART_TTL
+
+
+@externalCall("billboard")
+def fetchChart(headers):
+  source = session.get(CHART_URL, headers=headers, timeout=15)
+  source.raise_for_status()
+  return source
+
+
+def refreshChart():
+  with refreshLock:
+    if fresh():
+      return
+    headers = {}
+    if chart["songs"] and chart["etag"]:
+      headers["If-None-Match"] = chart["etag"]
+    if chart["songs"] and chart["lastModified"]:
+      headers["If-Modified-Since"] = chart["lastModified"]
+    try:
+      source = fetchChart(headers)
+    except req.RequestException as e:
+      #Keep answering with the old chart if there is one
+      if chart["songs"]:
+        log.warning("Chart refresh failed, using cached chart: %s", e)
+        return
+      raise
+    if source.status_code != 304:
+      chart["songs"] = parseChart(source.text)
+      chart["etag"] = source.headers.get("ETag")
+      chart["lastModified"] = source.headers.get("Last-Modified")
+    chart["fetchedAt"] = time.time()
+    saveChart()
+
+
+def getSongs(first, last):
+  if not fresh():
+    refreshChart()
+  return chart["songs"][first:last]
+
+
+loadChart()